@@ -0,0 +1,401 @@
+"""
+/***************************************************************************
+ benchmark - Timings for the grid generation engine.
+                                 A QGIS plugin
+ Overlays a user-definable grid on the map.
+                             -------------------
+        begin                : 2026-10-18
+        copyright            : (C) 2026 by agent
+        email                : agent@local
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Run from the plugin directory:
+
+    python benchmark.py [cells ...]
+    python benchmark.py labels [count ...]
+    python benchmark.py tiles [pixels ...]
+    python benchmark.py suite [--help]
+
+The suite times each stage of the grid layer over a sweep of grid sizes,
+angles and label settings, running against stubqgis when QGIS isn't
+installed.
+"""
+
+import argparse
+import gc
+import json
+import os
+import pickle
+import sys
+import time
+import timeit
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from gridgeometry import GridGeometry, basisVectors, HORIZONTAL, VERTICAL
+from util import Angle, AngleFormat
+
+try:
+    from qgis.core import QgsPoint
+except ImportError:
+    class QgsPoint(object):
+        def __init__(self, x=0.0, y=0.0):
+            self._x = x
+            self._y = y
+
+        def x(self):
+            return self._x
+
+        def y(self):
+            return self._y
+
+
+def legacyGrid(origin, baseVec, perpVec, offsetX, offsetY, numCellsX, numCellsY):
+    '''The per-vertex loop that generateGrid used before the NumPy engine.'''
+    grid = []
+
+    for h in xrange(offsetY, numCellsY + offsetY + 1):
+        line = []
+
+        for l in xrange(offsetX, numCellsX + offsetX + 1):
+            bar = (perpVec * h) + (baseVec * l)
+            line.append(QgsPoint(origin.x() + bar.x, origin.y() + bar.y))
+
+        grid.append(line)
+
+    for v in xrange(offsetX, numCellsX + offsetX + 1):
+        line = []
+
+        for l in xrange(offsetY, numCellsY + offsetY + 1):
+            bar = (baseVec * v) + (perpVec * l)
+            line.append(QgsPoint(origin.x() + bar.x, origin.y() + bar.y))
+
+        grid.append(line)
+
+    return grid
+
+
+def materialise(geometry):
+    '''Computes every line of an implicit GridGeometry, as draw() would unculled.'''
+    return [geometry.line(axis, line, first, last)
+            for axis, line, first, last in geometry.lineSpans()]
+
+
+def checkIdentical(legacy, geometry):
+    for i, (xs, ys) in enumerate(materialise(geometry)):
+        for j, p in enumerate(legacy[i]):
+            if p.x() != xs[j] or p.y() != ys[j]:
+                return False
+
+    return True
+
+
+def run(cells, repeat=3):
+    origin = QgsPoint(1000.0, -2000.0)
+    baseVec, perpVec = basisVectors(10.0, 25.0, 30.0)
+    args = (origin, baseVec, perpVec, -3, 2, cells, cells)
+
+    legacy = min(timeit.repeat(lambda: legacyGrid(*args), number=1, repeat=repeat))
+    batched = min(timeit.repeat(lambda: materialise(GridGeometry(*args)), number=1, repeat=repeat))
+    identical = checkIdentical(legacyGrid(*args), GridGeometry(*args))
+
+    print('{0:>6}x{0:<6} legacy {1:9.4f}s  numpy {2:9.4f}s  speedup {3:7.1f}x  identical {4}'.format(
+        cells, legacy, batched, legacy / max(batched, 1e-9), identical))
+
+
+def runLabels(count, repeat=3):
+    '''
+    Times degrees/minutes/seconds formatting of count edge label values,
+    parsing the spec on every call as Angle.__format__ used to, with a
+    compiled AngleFormat, and with its memoized labels.
+    '''
+    spec = u'%0D\u00b0 %0M\' %0S".%2s %e'
+    formatter = AngleFormat(spec)
+    # Edge labels of a geographic grid repeat across redraws.
+    values = [-180.0 + (i % 360) * 1.0 for i in xrange(count)]
+
+    def parsed():
+        for value in values:
+            AngleFormat(spec).format(Angle(value))
+
+    def compiled():
+        for value in values:
+            formatter.format(Angle(value))
+
+    def memoized():
+        for value in values:
+            formatter.formatValue(value)
+
+    times = [min(timeit.repeat(f, number=1, repeat=repeat)) for f in (parsed, compiled, memoized)]
+
+    print('{0:>8} labels  parsed {1:9.4f}s  compiled {2:9.4f}s  memoized {3:9.4f}s'.format(
+        count, *times))
+
+
+def runTiles(size, cells=200, repeat=3):
+    '''
+    Times stroking a rotated grid of cells x cells onto a size x size image
+    directly and with renderTiles on 1, 2, 4... threads, checking that the
+    images are identical. Needs PyQt4.
+    '''
+    import numpy
+    from PyQt4 import QtCore, QtGui
+    from gridworker import renderTiles
+
+    app = QtGui.QApplication.instance() or QtGui.QApplication(sys.argv, False)
+
+    spacing = size / (cells * 1.5)
+    baseVec, perpVec = basisVectors(spacing, spacing, 30.0)
+    geometry = GridGeometry(QgsPoint(size / 2.0, -size / 4.0), baseVec, perpVec, 0, 0, cells, cells)
+    lines = [geometry.line(axis, line) for axis, line in
+             [(HORIZONTAL, row) for row in xrange(geometry.numRows)] +
+             [(VERTICAL, col) for col in xrange(geometry.numCols)]]
+    polylines = [QtGui.QPolygonF([QtCore.QPointF(x, y) for x, y in zip(xs, ys)]) for xs, ys in lines]
+    bounds = numpy.array([(xs.min(), ys.min(), xs.max(), ys.max()) for xs, ys in lines])
+
+    pen = QtGui.QPen(QtGui.QColor(0, 160, 0))
+    pen.setWidthF(1.5)
+
+    def render(painter, tilePolylines):
+        painter.setPen(pen)
+        for polyline in tilePolylines:
+            painter.drawPolyline(polyline)
+
+    def paint(threads):
+        image = QtGui.QImage(size, size, QtGui.QImage.Format_ARGB32_Premultiplied)
+        image.fill(QtGui.QColor(255, 255, 255).rgba())
+        painter = QtGui.QPainter(image)
+        painter.setRenderHint(QtGui.QPainter.Antialiasing)
+        if threads == 0:
+            render(painter, polylines)
+        else:
+            renderTiles(painter, polylines, bounds, render, maxThreads=threads)
+        painter.end()
+        return image
+
+    serial = min(timeit.repeat(lambda: paint(0), number=1, repeat=repeat))
+    reference = paint(0)
+    results = []
+
+    threads = 1
+    while threads <= max(QtCore.QThread.idealThreadCount(), 1):
+        elapsed = min(timeit.repeat(lambda: paint(threads), number=1, repeat=repeat))
+        results.append('{0} threads {1:8.4f}s {2:5.1f}x'.format(threads, elapsed, serial / max(elapsed, 1e-9)))
+        if paint(threads) != reference:
+            results[-1] += ' DIFFERS'
+        threads *= 2
+
+    print('{0:>6}px  serial {1:8.4f}s  {2}'.format(size, serial, '  '.join(results)))
+
+
+def measure(function):
+    '''
+    Returns the seconds function takes, its peak memory in KB and its
+    result. The measured call runs in a forked child, and the peak is how
+    far it raised the child's peak resident size, NumPy's arrays included.
+    function then runs again here, unmeasured, so that later stages see
+    its effects. Where there's no fork the call is measured here, without
+    the peak.
+    '''
+    gc.collect()
+
+    if not hasattr(os, 'fork') or resource is None:
+        start = time.time()
+        result = function()
+        return time.time() - start, None, result
+
+    read, write = os.pipe()
+    pid = os.fork()
+
+    if pid == 0:
+        status = 1
+        try:
+            os.close(read)
+            maxrss = _maxrss()
+            start = time.time()
+            result = function()
+            seconds = time.time() - start
+            with os.fdopen(write, 'wb') as f:
+                pickle.dump((seconds, max(_maxrss() - maxrss, 0), result), f, pickle.HIGHEST_PROTOCOL)
+            status = 0
+        except:
+            import traceback
+            traceback.print_exc()
+        finally:
+            os._exit(status)
+
+    os.close(write)
+    with os.fdopen(read, 'rb') as f:
+        data = f.read()
+    os.waitpid(pid, 0)
+
+    if not data:
+        raise RuntimeError('The measured stage failed')
+
+    function()
+    return pickle.loads(data)
+
+
+def _maxrss():
+    # Kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def suiteConfigs(sizes, angles, labelTypes, labelFormats, projections):
+    '''
+    Yields the sweep's configurations. Label formats only apply to
+    coordinate labels, so the other label types use the first format only.
+    '''
+    for cells in sizes:
+        for angle in angles:
+            for projection in projections:
+                for labelType in labelTypes:
+                    for labelFormat in (labelFormats if labelType == 0 else labelFormats[:1]):
+                        yield {'cells': cells * cells, 'angle': angle, 'projection': projection,
+                               'label_type': labelType, 'label_format': labelFormat}
+
+
+def runConfig(config, width=1000, height=800):
+    '''
+    Returns a record per stage for a grid of config['cells'] cells covering
+    60 degrees square, viewed whole on a width x height canvas.
+    '''
+    import stubqgis
+    stubqgis.install()
+    from qgis import core
+    from gridpluginlayer import GridPluginLayer
+
+    if config['projection'] == 'mercator':
+        stubqgis.projectSrsid = stubqgis.MERCATOR_SRSID
+    else:
+        stubqgis.projectSrsid = stubqgis.GEOGRAPHIC_SRSID
+
+    side = int(round(config['cells'] ** 0.5))
+    layer = GridPluginLayer()
+    layer.setCrs(core.QgsCoordinateReferenceSystem(stubqgis.GEOGRAPHIC_SRSID,
+                                                   core.QgsCoordinateReferenceSystem.InternalCrsId))
+    layer.origin = core.QgsPoint(-30.0, -30.0)
+    layer.numCellsX = layer.numCellsY = side
+    layer.cellSizeX = layer.cellSizeY = 60.0 / side
+    layer.baselineAngle = float(config['angle'])
+    layer.draw_labels = True
+    layer.label_type = config['label_type']
+    layer.label_format = config['label_format']
+    layer.label_precision = 2
+
+    records = []
+
+    def counted(function):
+        stubqgis.Counter.reset()
+        function()
+        return stubqgis.Counter.polylines, stubqgis.Counter.vertices, stubqgis.Counter.labels
+
+    def stage(name, function):
+        seconds, peakKB, (polylines, vertices, labels) = measure(lambda: counted(function))
+        record = dict(config, stage=name, seconds=seconds, peak_kb=peakKB,
+                      polylines=polylines, vertices=vertices, labels=labels)
+        records.append(record)
+
+    stage('generateGrid', layer.generateGrid)
+    stage('generateLabels', layer.generateLabels)
+
+    xmin, ymin, xmax, ymax = layer.projectedExtent()
+    pad = (xmax - xmin) * 0.01
+    extent = core.QgsRectangle(xmin - pad, ymin - pad, xmax + pad, ymax + pad)
+    renderContext = core.QgsRenderContext(extent, width, height)
+
+    stage('draw', lambda: layer.draw(renderContext))
+    stage('draw (cached)', lambda: layer.draw(renderContext))
+    stage('drawLabels', lambda: layer.drawLabels(renderContext))
+    stage('drawLabels (cached)', lambda: layer.drawLabels(renderContext))
+
+    values = layer.grid.line(0, 0)[0]
+    stage('formatLabel', lambda: [layer.formatLabel(value, '%e', True) for value in values])
+
+    return records
+
+
+def recordKey(record):
+    return (record['cells'], record['angle'], record['projection'], record['label_type'],
+            record['label_format'], record['stage'])
+
+
+def runSuite(argv):
+    parser = argparse.ArgumentParser(prog='benchmark.py suite',
+                                     description='Times the stages of the grid layer over a sweep of settings.')
+    parser.add_argument('--sizes', default='10,100,1000',
+                        help='cells along each side, comma separated (default: %(default)s)')
+    parser.add_argument('--angles', default='0,30', help='baseline angles (default: %(default)s)')
+    parser.add_argument('--label-types', default='0,1,2', help='label types (default: %(default)s)')
+    parser.add_argument('--label-formats', default='0,1,2', help='label formats (default: %(default)s)')
+    parser.add_argument('--projections', default='none,mercator',
+                        help='project CRS for a geographic grid, none or mercator (default: %(default)s)')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare against the results in this JSON file')
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help='slowdown against the baseline that counts as a regression (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    numbers = lambda text: [int(n) for n in text.split(',') if n]
+    configs = suiteConfigs(numbers(args.sizes), numbers(args.angles), numbers(args.label_types),
+                           numbers(args.label_formats), [p for p in args.projections.split(',') if p])
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = dict((recordKey(record), record) for record in json.load(f))
+
+    results = []
+    regressions = 0
+
+    print('{0:>9} {1:>5} {2:>9} {3:>4} {4:>6} {5:<20} {6:>10} {7:>10} {8:>9}'.format(
+        'cells', 'angle', 'crs', 'type', 'format', 'stage', 'seconds', 'peak KB', 'baseline'))
+
+    for config in configs:
+        for record in runConfig(config):
+            results.append(record)
+            comparison = ''
+            previous = baseline.get(recordKey(record))
+
+            if previous is not None:
+                ratio = record['seconds'] / max(previous['seconds'], 1e-6)
+                comparison = '{0:.2f}x'.format(ratio)
+                # Ignore noise in stages too quick to time reliably.
+                if ratio > args.tolerance and record['seconds'] > 0.001:
+                    comparison += ' SLOWER'
+                    regressions += 1
+
+            print('{cells:>9} {angle:>5} {projection:>9} {label_type:>4} {label_format:>6} {stage:<20} '
+                  '{seconds:10.4f} {peak_kb:>10} {0:>9}'.format(comparison, **record))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['suite']:
+        sys.exit(runSuite(sys.argv[2:]))
+    elif sys.argv[1:2] == ['labels']:
+        for count in [int(arg) for arg in sys.argv[2:]] or [1000, 10000, 100000]:
+            runLabels(count)
+    elif sys.argv[1:2] == ['tiles']:
+        for size in [int(arg) for arg in sys.argv[2:]] or [2000, 4000, 8000]:
+            runTiles(size)
+    else:
+        for cells in [int(arg) for arg in sys.argv[1:]] or [10, 100, 500, 1000]:
+            run(cells)
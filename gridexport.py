@@ -0,0 +1,246 @@
+"""
+/***************************************************************************
+ gridexport - Writes grids to vector files with OGR, without QGIS.
+                                 A QGIS plugin
+ Overlays a user-definable grid on the map.
+                             -------------------
+        begin                : 2026-10-18
+        copyright            : (C) 2026 by agent
+        email                : agent@local
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Run from the plugin directory to export a grid from the command line:
+
+    python gridexport.py grid.gpkg --cells 1000 1000 --size 10 10 --angle 30
+    python gridexport.py --help
+"""
+
+import argparse
+import os
+import struct
+
+import numpy
+
+from gridgeometry import HORIZONTAL, _Point, buildGrid
+
+try:
+    from osgeo import ogr, osr
+except ImportError:
+    ogr = None
+    osr = None
+
+DRIVERS = {'.gpkg': 'GPKG', '.shp': 'ESRI Shapefile', '.geojson': 'GeoJSON', '.json': 'GeoJSON'}
+
+# Features written per transaction.
+CHUNK_SIZE = 10000
+
+
+class ExportError(Exception):
+    pass
+
+
+def defaultReference(cellx, celly):
+    return u'{0} {1}'.format(cellx, celly)
+
+
+def exportGrid(grid, path, lines=True, cells=True, srsWkt=None, referenceText=defaultReference,
+               driverName=None, chunkSize=CHUNK_SIZE):
+    '''
+    Writes a GridGeometry to a vector file as a 'grid_lines' layer of
+    LineStrings and a 'grid_cells' layer of cell Polygons, as selected. The
+    driver follows from the file extension unless driverName is given.
+    Formats with a single layer per file, such as Shapefile and GeoJSON,
+    get one file per layer, suffixed with the layer name.
+
+    Features are streamed a row of cells at a time and committed every
+    chunkSize features, so memory use doesn't depend on the grid size.
+    Returns the paths written.
+    '''
+    if ogr is None:
+        raise ExportError('Exporting the grid needs the GDAL/OGR Python bindings')
+
+    if driverName is None:
+        driverName = DRIVERS.get(os.path.splitext(path)[1].lower())
+        if driverName is None:
+            raise ExportError('Unknown vector format for {0}'.format(path))
+
+    driver = ogr.GetDriverByName(driverName)
+    if driver is None:
+        raise ExportError('OGR has no {0} driver'.format(driverName))
+
+    srs = None
+    if srsWkt:
+        srs = osr.SpatialReference()
+        srs.ImportFromWkt(srsWkt)
+
+    layers = []
+    if lines:
+        layers.append(('grid_lines', ogr.wkbLineString, _lineFields(), _lineFeatures(grid)))
+    if cells:
+        layers.append(('grid_cells', ogr.wkbPolygon, _cellFields(), _cellFeatures(grid, referenceText)))
+
+    multiLayer = driverName == 'GPKG'
+    paths = []
+    dataSource = None
+
+    for name, geometryType, fields, features in layers:
+        if dataSource is None or not multiLayer:
+            layerPath = path if multiLayer or len(layers) == 1 else _suffixed(path, name)
+            dataSource = _create(driver, layerPath)
+            paths.append(layerPath)
+
+        layer = dataSource.CreateLayer(name, srs, geometryType)
+        if layer is None:
+            raise ExportError('Could not create layer {0} in {1}'.format(name, path))
+
+        for fieldName, fieldType, width in fields:
+            fieldDefn = ogr.FieldDefn(fieldName, fieldType)
+            if width:
+                fieldDefn.SetWidth(width)
+            layer.CreateField(fieldDefn)
+
+        _writeFeatures(layer, features, chunkSize)
+
+        if not multiLayer:
+            dataSource = None
+
+    return paths
+
+
+def _create(driver, path):
+    if os.path.exists(path):
+        driver.DeleteDataSource(path)
+
+    dataSource = driver.CreateDataSource(path)
+    if dataSource is None:
+        raise ExportError('Could not create {0}'.format(path))
+
+    return dataSource
+
+
+def _suffixed(path, name):
+    root, ext = os.path.splitext(path)
+    return '{0}_{1}{2}'.format(root, name, ext)
+
+
+def _writeFeatures(layer, features, chunkSize):
+    defn = layer.GetLayerDefn()
+    written = 0
+
+    layer.StartTransaction()
+
+    for attributes, wkb in features:
+        feature = ogr.Feature(defn)
+        for i, value in enumerate(attributes):
+            feature.SetField(i, value)
+        feature.SetGeometryDirectly(ogr.CreateGeometryFromWkb(wkb))
+        layer.CreateFeature(feature)
+        feature = None
+
+        written += 1
+        if written % chunkSize == 0:
+            layer.CommitTransaction()
+            layer.StartTransaction()
+
+    layer.CommitTransaction()
+
+
+def _lineFields():
+    return [('axis', ogr.OFTString, 10), ('line', ogr.OFTInteger, 0)]
+
+
+def _cellFields():
+    return [('col', ogr.OFTInteger, 0), ('row', ogr.OFTInteger, 0), ('reference', ogr.OFTString, 32)]
+
+
+def _lineFeatures(grid):
+    '''Yields ((axis, line), wkb) for every line of the grid.'''
+    for axis, line, first, last in grid.lineSpans():
+        xs, ys = grid.line(axis, line, first, last)
+        yield ('horizontal' if axis == HORIZONTAL else 'vertical', line), lineStringWkb(xs, ys)
+
+
+def _cellFeatures(grid, referenceText):
+    '''Yields ((col, row, reference), wkb) for every cell, a row at a time.'''
+    cols = numpy.arange(grid.numCellsX + 1)
+
+    for row in xrange(grid.numCellsY):
+        lowerXs, lowerYs = grid.vertices(cols, row)
+        upperXs, upperYs = grid.vertices(cols, row + 1)
+        # Each ring runs anticlockwise round the cell in grid space and
+        # closes on its first corner.
+        ringXs = numpy.column_stack((lowerXs[:-1], lowerXs[1:], upperXs[1:], upperXs[:-1], lowerXs[:-1]))
+        ringYs = numpy.column_stack((lowerYs[:-1], lowerYs[1:], upperYs[1:], upperYs[:-1], lowerYs[:-1]))
+
+        for col, wkb in enumerate(polygonWkbs(ringXs, ringYs)):
+            yield (col, row, referenceText(col, row)), wkb
+
+
+def lineStringWkb(xs, ys):
+    '''Returns the little-endian WKB of a LineString.'''
+    coordinates = numpy.empty((len(xs), 2), dtype='<f8')
+    coordinates[:, 0] = xs
+    coordinates[:, 1] = ys
+    return struct.pack('<BII', 1, 2, len(xs)) + coordinates.tostring()
+
+
+def polygonWkbs(ringXs, ringYs):
+    '''
+    Returns the little-endian WKB of single-ring Polygons, one per row of
+    the (n, points) ring coordinate arrays, built together.
+    '''
+    count, points = ringXs.shape
+    record = numpy.dtype([('order', 'u1'), ('type', '<u4'), ('rings', '<u4'), ('points', '<u4'),
+                          ('coordinates', '<f8', (points, 2))])
+    records = numpy.empty(count, dtype=record)
+    records['order'] = 1
+    records['type'] = 3
+    records['rings'] = 1
+    records['points'] = points
+    records['coordinates'][:, :, 0] = ringXs
+    records['coordinates'][:, :, 1] = ringYs
+
+    data = records.tostring()
+    size = record.itemsize
+    return [data[i * size:(i + 1) * size] for i in xrange(count)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Writes a grid overlay to a vector file.')
+    parser.add_argument('path', help='output file: .gpkg, .shp or .geojson')
+    parser.add_argument('--origin', nargs=2, type=float, default=(0.0, 0.0), metavar=('X', 'Y'))
+    parser.add_argument('--cells', nargs=2, type=int, default=(1, 1), metavar=('X', 'Y'))
+    parser.add_argument('--size', nargs=2, type=float, default=(10.0, 10.0), metavar=('X', 'Y'))
+    parser.add_argument('--offset', nargs=2, type=int, default=(0, 0), metavar=('X', 'Y'))
+    parser.add_argument('--angle', type=float, default=0.0, help='baseline angle in degrees')
+    parser.add_argument('--srs', help='coordinate system, e.g. EPSG:4326')
+    parser.add_argument('--no-lines', action='store_true', help="don't write the grid lines")
+    parser.add_argument('--no-cells', action='store_true', help="don't write the cell polygons")
+    args = parser.parse_args(argv)
+
+    grid = buildGrid(_Point(*args.origin), args.size[0], args.size[1], args.angle,
+                     args.offset[0], args.offset[1], args.cells[0], args.cells[1])
+
+    srsWkt = None
+    if args.srs:
+        if osr is None:
+            raise ExportError('Exporting the grid needs the GDAL/OGR Python bindings')
+        srs = osr.SpatialReference()
+        srs.SetFromUserInput(args.srs)
+        srsWkt = srs.ExportToWkt()
+
+    for path in exportGrid(grid, args.path, not args.no_lines, not args.no_cells, srsWkt):
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
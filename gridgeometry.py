@@ -0,0 +1,376 @@
+"""
+/***************************************************************************
+ gridgeometry - Batched NumPy generation of grid vertices.
+                                 A QGIS plugin
+ Overlays a user-definable grid on the map.
+                             -------------------
+        begin                : 2026-10-18
+        copyright            : (C) 2026 by agent
+        email                : agent@local
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import math
+
+import numpy
+
+from util import Basis, QgsVector
+
+HORIZONTAL = 0
+VERTICAL = 1
+
+
+def pointsExtent(xs, ys):
+    '''
+    Returns the (xmin, ymin, xmax, ymax) of the finite points among xs and
+    ys, or None if there are none.
+    '''
+    xs = numpy.asarray(xs, dtype=numpy.float64)
+    ys = numpy.asarray(ys, dtype=numpy.float64)
+    finite = numpy.isfinite(xs) & numpy.isfinite(ys)
+
+    if not numpy.any(finite):
+        return None
+
+    xs, ys = xs[finite], ys[finite]
+    return float(xs.min()), float(ys.min()), float(xs.max()), float(ys.max())
+
+
+class _Point(object):
+    def __init__(self, x, y):
+        self._x = x
+        self._y = y
+
+    def x(self):
+        return self._x
+
+    def y(self):
+        return self._y
+
+
+def basisVectors(cellSizeX, cellSizeY, baselineAngle):
+    '''
+    Returns the (base, perpendicular) cell vectors for a grid rotated by
+    baselineAngle degrees clockwise.
+    '''
+    baseVec = QgsVector(1.0, 0.0).rotateBy(math.radians(360.0 - baselineAngle)) * cellSizeX
+    perpVec = baseVec.perpVector().normal() * cellSizeY
+    return baseVec, perpVec
+
+
+def buildGrid(origin, cellSizeX, cellSizeY, baselineAngle, offsetX, offsetY, numCellsX, numCellsY):
+    '''Builds a GridGeometry from the grid layer properties.'''
+    baseVec, perpVec = basisVectors(cellSizeX, cellSizeY, baselineAngle)
+    return GridGeometry(origin, baseVec, perpVec, offsetX, offsetY, numCellsX, numCellsY)
+
+
+class GridGeometry(object):
+    '''
+    A regular grid in layer CRS, described only by its origin, two basis
+    vectors and index ranges. Vertices are computed on demand, so the memory
+    used doesn't depend on the number of cells.
+
+    Vertex (col, row) is at origin + (row + offsetY) * perpVec +
+    (col + offsetX) * baseVec. Row r is horizontal line r and column c is
+    vertical line c.
+    '''
+
+    def __init__(self, origin, baseVec, perpVec, offsetX, offsetY, numCellsX, numCellsY):
+        self.originX = origin.x()
+        self.originY = origin.y()
+        self.offsetX = offsetX
+        self.offsetY = offsetY
+        self.numCellsX = numCellsX
+        self.numCellsY = numCellsY
+        self.numCols = numCellsX + 1
+        self.numRows = numCellsY + 1
+        self.baseVec = baseVec
+        self.perpVec = perpVec
+        self.basis = Basis(self.originX, self.originY, baseVec, perpVec)
+
+        # The grid is a parallelogram, so its corners bound it exactly.
+        self.extent = pointsExtent(*self.vertices((0, numCellsX, 0, numCellsX),
+                                                  (0, 0, numCellsY, numCellsY)))
+
+    def boundary(self, samples):
+        '''
+        Returns the (xs, ys) of a closed ring around the grid's edges, with
+        samples points along each edge.
+        '''
+        t = numpy.linspace(0.0, 1.0, samples, endpoint=False)
+        cols = numpy.concatenate((t * self.numCellsX, numpy.repeat(self.numCellsX, samples),
+                                  (1.0 - t) * self.numCellsX, numpy.zeros(samples + 1)))
+        rows = numpy.concatenate((numpy.zeros(samples), t * self.numCellsY,
+                                  numpy.repeat(self.numCellsY, samples), (1.0 - t) * self.numCellsY, (0.0,)))
+
+        return self.vertices(cols, rows)
+
+    def subdivide(self, divisionsX, divisionsY):
+        '''
+        Returns the grid that divides each of this grid's cells into
+        divisionsX by divisionsY cells. Its lines that are onStride of the
+        divisions lie on this grid's lines.
+        '''
+        return GridGeometry(_Point(self.originX, self.originY),
+                            self.baseVec / float(divisionsX), self.perpVec / float(divisionsY),
+                            self.offsetX * divisionsX, self.offsetY * divisionsY,
+                            self.numCellsX * divisionsX, self.numCellsY * divisionsY)
+
+    def vertices(self, cols, rows):
+        '''
+        Returns the (xs, ys) of the vertices at the given column and row
+        positions, broadcast against each other.
+        '''
+        return self.basis.apply(numpy.add(cols, self.offsetX, dtype=numpy.float64),
+                                numpy.add(rows, self.offsetY, dtype=numpy.float64))
+
+    def vertex(self, col, row):
+        x, y = self.vertices(col, row)
+        return float(x), float(y)
+
+    def line(self, axis, line, first=0, last=None):
+        '''Returns the (xs, ys) of vertices first to last of a line.'''
+        if last is None:
+            last = (self.numCols if axis == HORIZONTAL else self.numRows) - 1
+
+        return self.linePoints(axis, line, numpy.arange(first, last + 1))
+
+    def linePoints(self, axis, line, positions):
+        '''Returns the (xs, ys) of the points at positions along a line.'''
+        if axis == HORIZONTAL:
+            return self.vertices(positions, line)
+        else:
+            return self.vertices(line, positions)
+
+    def toLattice(self, x, y):
+        '''
+        Inverts the origin/basis mapping, returning the fractional (column,
+        row) positions of layer CRS coordinates.
+        '''
+        cols, rows = self.basis.solve(x, y)
+        return cols - self.offsetX, rows - self.offsetY
+
+    def cellsAt(self, x, y):
+        '''
+        Returns the (cols, rows, inside) arrays of the cells containing layer
+        CRS coordinates, where inside is False for points off the grid.
+        '''
+        cols, rows = self.toLattice(x, y)
+        cols = numpy.floor(cols)
+        rows = numpy.floor(rows)
+        inside = (cols >= 0) & (cols < self.numCellsX) & (rows >= 0) & (rows < self.numCellsY)
+        return cols.astype(numpy.int64), rows.astype(numpy.int64), inside
+
+    def cellBlock(self, xmin, ymin, xmax, ymax):
+        '''
+        Returns the (firstCol, lastCol, firstRow, lastRow) block of cells that
+        covers the rectangle, or None if it misses the grid.
+        '''
+        cols, rows = self.toLattice((xmin, xmax, xmin, xmax), (ymin, ymin, ymax, ymax))
+        firstCol = max(int(math.floor(cols.min())), 0)
+        lastCol = min(int(math.floor(cols.max())), self.numCellsX - 1)
+        firstRow = max(int(math.floor(rows.min())), 0)
+        lastRow = min(int(math.floor(rows.max())), self.numCellsY - 1)
+
+        if firstCol > lastCol or firstRow > lastRow:
+            return None
+
+        return firstCol, lastCol, firstRow, lastRow
+
+    def cellCentre(self, col, row):
+        xs, ys = self.vertices(col, row)
+        return (xs + (self.baseVec.x + self.perpVec.x) / 2.0,
+                ys + (self.baseVec.y + self.perpVec.y) / 2.0)
+
+    def lineSpans(self, rowStride=1, colStride=1):
+        '''
+        Yields (axis, line, first, last) for every horizontal line, then every
+        vertical line. With strides, only every rowStride'th horizontal and
+        colStride'th vertical line is included, counting from the origin.
+        '''
+        for row in self._strideLines(HORIZONTAL, rowStride):
+            yield HORIZONTAL, int(row), 0, self.numCols - 1
+
+        for col in self._strideLines(VERTICAL, colStride):
+            yield VERTICAL, int(col), 0, self.numRows - 1
+
+    def clipLine(self, axis, line, xmin, ymin, xmax, ymax):
+        '''
+        Returns the (lo, hi) positions along a line between which it is inside
+        the rectangle; lo > hi if it misses.
+        '''
+        lo, hi = self._clipLines(axis, numpy.array([line]), xmin, ymin, xmax, ymax)
+        return float(lo[0]), float(hi[0])
+
+    def visibleLineSpans(self, xmin, ymin, xmax, ymax, rowStride=1, colStride=1):
+        '''
+        Yields (axis, line, first, last) for the parts of the lines that cross
+        the rectangle, from the last vertex before it to the first vertex
+        after it. Strides are as for lineSpans.
+        '''
+        for axis, stride in ((HORIZONTAL, rowStride), (VERTICAL, colStride)):
+            lines = self._strideLines(axis, stride)
+            lo, hi = self._clipLines(axis, lines, xmin, ymin, xmax, ymax)
+
+            for i, first, last in _vertexRanges(lo, hi):
+                yield axis, int(lines[i]), first, last
+
+    def onStride(self, axis, lines, stride):
+        '''
+        Returns a mask of which lines (or cells) are multiples of stride away
+        from the origin.
+        '''
+        offset = self.offsetY if axis == HORIZONTAL else self.offsetX
+        return (numpy.asarray(lines) + offset) % stride == 0
+
+    def _strideLines(self, axis, stride):
+        lines = numpy.arange(self.numRows if axis == HORIZONTAL else self.numCols)
+
+        if stride > 1:
+            lines = lines[self.onStride(axis, lines, stride)]
+
+        return lines
+
+    def _clipLines(self, axis, lines, xmin, ymin, xmax, ymax):
+        if axis == HORIZONTAL:
+            startX, startY = self.vertices(0, lines)
+            direction, length = self.baseVec, self.numCellsX
+        else:
+            startX, startY = self.vertices(lines, 0)
+            direction, length = self.perpVec, self.numCellsY
+
+        return _clipParameters(startX, startY, direction, 0, length,
+                               xmin, ymin, xmax, ymax)
+
+
+def _clipParameters(startX, startY, direction, tmin, tmax, xmin, ymin, xmax, ymax):
+    '''
+    Liang-Barsky clip of the parallel lines start + t * direction, with t in
+    [tmin, tmax], against a rectangle.
+
+    Returns the (lo, hi) parameter arrays; lines that miss the rectangle have
+    lo > hi.
+    '''
+    lo = numpy.empty_like(startX)
+    hi = numpy.empty_like(startX)
+    lo.fill(tmin)
+    hi.fill(tmax)
+
+    for start, d, low, high in ((startX, direction.x, xmin, xmax),
+                                (startY, direction.y, ymin, ymax)):
+        if d == 0.0:
+            outside = (start < low) | (start > high)
+            lo[outside] = numpy.inf
+        else:
+            t1 = (low - start) / d
+            t2 = (high - start) / d
+            lo = numpy.maximum(lo, numpy.minimum(t1, t2))
+            hi = numpy.minimum(hi, numpy.maximum(t1, t2))
+
+    return lo, hi
+
+
+def _vertexRanges(lo, hi):
+    '''Yields (line, first, last) vertex index ranges for the clipped lines.'''
+    visible = numpy.nonzero(lo <= hi)[0]
+    firsts = numpy.floor(lo[visible]).astype(numpy.int64)
+    lasts = numpy.ceil(hi[visible]).astype(numpy.int64)
+
+    for line, first, last in zip(visible, firsts, lasts):
+        if last > first:
+            yield int(line), int(first), int(last)
+
+
+class AffineTransform(object):
+    '''
+    A 2D affine transform applied to whole coordinate arrays at once.
+
+    Coordinates are taken relative to a reference point, which keeps the
+    precision when map coordinates are large.
+    '''
+
+    def __init__(self, refX, refY, refU, refV, a, b, d, e):
+        self.refX = refX
+        self.refY = refY
+        self.refU = refU
+        self.refV = refV
+        self.a = a
+        self.b = b
+        self.d = d
+        self.e = e
+
+    @classmethod
+    def fromMapToPixel(cls, mapToPixel, xmin, ymin, width, height):
+        '''
+        Recovers the scale, rotation and offset of a QgsMapToPixel by
+        transforming three points of the given rectangle.
+        '''
+        width = width or 1.0
+        height = height or 1.0
+
+        p0 = mapToPixel.transform(xmin, ymin)
+        px = mapToPixel.transform(xmin + width, ymin)
+        py = mapToPixel.transform(xmin, ymin + height)
+
+        return cls(xmin, ymin, p0.x(), p0.y(),
+                   (px.x() - p0.x()) / width, (py.x() - p0.x()) / height,
+                   (px.y() - p0.y()) / width, (py.y() - p0.y()) / height)
+
+    def apply(self, xs, ys):
+        dx = xs - self.refX
+        dy = ys - self.refY
+        return (self.refU + self.a * dx + self.b * dy,
+                self.refV + self.d * dx + self.e * dy)
+
+
+def densifyLine(project, xs, ys, pxs, pys, tolerance, maxDepth=8):
+    '''
+    Adds vertices to a straight line in layer CRS until its projection by
+    project is within tolerance of the true curve. Returns (pxs, pys, positions).
+    '''
+    count = len(xs)
+    positions = numpy.arange(count, dtype=numpy.float64)
+    extraT = []
+    extraX = []
+    extraY = []
+
+    # Pending segments as (start parameter, end parameter, projected ends).
+    ta = positions[:-1]
+    tb = positions[1:]
+    ax, ay = pxs[:-1], pys[:-1]
+    bx, by = pxs[1:], pys[1:]
+
+    for depth in xrange(maxDepth):
+        if len(ta) == 0:
+            break
+
+        tm = (ta + tb) / 2.0
+        mx, my = project(numpy.interp(tm, positions, xs), numpy.interp(tm, positions, ys))
+
+        split = numpy.hypot(mx - (ax + bx) / 2.0, my - (ay + by) / 2.0) > tolerance
+        tm, mx, my = tm[split], mx[split], my[split]
+        extraT.append(tm)
+        extraX.append(mx)
+        extraY.append(my)
+
+        ta = numpy.concatenate((ta[split], tm))
+        tb = numpy.concatenate((tm, tb[split]))
+        ax, bx = numpy.concatenate((ax[split], mx)), numpy.concatenate((mx, bx[split]))
+        ay, by = numpy.concatenate((ay[split], my)), numpy.concatenate((my, by[split]))
+
+    ts = numpy.concatenate([positions] + extraT)
+    order = numpy.argsort(ts, kind='mergesort')
+    denseX = numpy.concatenate([pxs] + extraX)[order]
+    denseY = numpy.concatenate([pys] + extraY)[order]
+    starts = numpy.searchsorted(ts[order], positions)
+
+    return denseX, denseY, starts
@@ -0,0 +1,67 @@
+"""
+/***************************************************************************
+ GridIdentifyTool - map tool that identifies the grid cell clicked on.
+                                 A QGIS plugin
+ Overlays a user-definable grid on the map.
+                             -------------------
+        begin                : 2026-10-18
+        copyright            : (C) 2026 by agent
+        email                : agent@local
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from PyQt4 import QtCore, QtGui
+from qgis import core, gui
+
+from gridpluginlayer import GridPluginLayer
+
+class GridIdentifyTool(gui.QgsMapTool):
+    '''
+    Shows the reference of the grid cell under a click, using the current
+    layer if it is a grid, otherwise the topmost grid on the canvas.
+    '''
+
+    def __init__(self, canvas, statusBar):
+        gui.QgsMapTool.__init__(self, canvas)
+        self.statusBar = statusBar
+        self.setCursor(QtGui.QCursor(QtCore.Qt.WhatsThisCursor))
+
+    def gridLayer(self):
+        layer = self.canvas().currentLayer()
+        if isinstance(layer, GridPluginLayer):
+            return layer
+
+        for layer in self.canvas().layers():
+            if isinstance(layer, GridPluginLayer):
+                return layer
+
+        return None
+
+    def canvasReleaseEvent(self, event):
+        layer = self.gridLayer()
+        if layer is None:
+            return
+
+        # Canvas coordinates are in project CRS.
+        try:
+            cell = layer.cellAt(self.toMapCoordinates(event.pos()), True)
+        except core.QgsCsException:
+            # The point has no coordinates in the layer's CRS.
+            cell = None
+
+        if cell is None:
+            text = 'Outside {0}'.format(layer.name())
+        else:
+            text = u'{0}: {1}'.format(layer.name(), cell[2])
+
+        self.statusBar.showMessage(text)
+        QtGui.QToolTip.showText(self.canvas().mapToGlobal(event.pos()), text, self.canvas())
@@ -25,6 +25,7 @@ from qgis import core
 from gridpropertiesdialog import GridPropertiesDialog
 from gridpluginlayertype import GridPluginLayerType
 from gridpluginlayer import GridPluginLayer
+from gridmaptool import GridIdentifyTool
 import resources
 
 class GridOverlay:
@@ -36,6 +37,9 @@ class GridOverlay:
         # Save reference to the QGIS interface
         self.iface = iface
         self.action_newGrid = None
+        self.action_identifyCell = None
+        self.action_vectorLayers = None
+        self.identifyTool = None
 
     def initGui(self):
         '''
@@ -51,6 +55,23 @@ class GridOverlay:
         self.iface.insertAddLayerAction(self.action_newGrid)
 
         self.action_newGrid.triggered.connect(self.run)
+
+        self.identifyTool = GridIdentifyTool(self.iface.mapCanvas(), self.iface.mainWindow().statusBar())
+        self.action_identifyCell = QtGui.QAction(
+                        QtGui.QIcon(":/icons/icon.png"),
+                        "Identify Grid Cell", self.iface.mainWindow())
+        self.action_identifyCell.setCheckable(True)
+        self.identifyTool.setAction(self.action_identifyCell)
+        self.iface.addToolBarIcon(self.action_identifyCell)
+
+        self.action_identifyCell.triggered.connect(self.identifyCell)
+
+        self.action_vectorLayers = QtGui.QAction(
+                        QtGui.QIcon(":/icons/icon.png"),
+                        "Toggle Grid as Vector Layers", self.iface.mainWindow())
+        self.iface.addPluginToMenu("&Grid Overlay", self.action_vectorLayers)
+
+        self.action_vectorLayers.triggered.connect(self.toggleVectorLayers)
         
         core.QgsPluginLayerRegistry.instance().addPluginLayerType(GridPluginLayerType())
         
@@ -60,7 +81,12 @@ class GridOverlay:
         '''
         self.iface.removeAddLayerAction(self.action_newGrid)
         self.iface.removeToolBarIcon(self.action_newGrid)
+        self.iface.removeToolBarIcon(self.action_identifyCell)
+        self.iface.removePluginMenu("&Grid Overlay", self.action_vectorLayers)
+        if self.iface.mapCanvas().mapTool() == self.identifyTool:
+            self.iface.mapCanvas().unsetMapTool(self.identifyTool)
         core.QgsPluginLayerRegistry.instance().removePluginLayerType(GridPluginLayer.LAYER_TYPE)
+        GridPluginLayer.releaseResources()
 
     def run(self):
         layer = GridPluginLayer()
@@ -68,3 +94,16 @@ class GridOverlay:
         
         if layer.isValid():
             core.QgsMapLayerRegistry.instance().addMapLayer(layer)
+
+    def identifyCell(self):
+        self.iface.mapCanvas().setMapTool(self.identifyTool)
+
+    def toggleVectorLayers(self):
+        '''
+        Switches the selected grid between drawing itself and being drawn,
+        and labelled, as memory provider vector layers.
+        '''
+        layer = self.iface.activeLayer()
+
+        if isinstance(layer, GridPluginLayer):
+            layer.setVectorLayersEnabled(layer.vectorLayers is None)
@@ -19,19 +19,273 @@
  ***************************************************************************/
 """
 
+import cProfile
 import math
+import os
+
+import numpy
 
 from PyQt4 import QtCore, QtGui, QtXml
 from qgis import core
 from qgis.core import QGis
 from util import *
 
+from gridgeometry import AffineTransform, HORIZONTAL, VERTICAL
+from gridgeometry import buildGrid, densifyLine, pointsExtent
+from gridworker import canRenderTiles, renderTiles
+from gridtilecache import TileCache
+from gridexport import ExportError, exportGrid
+from gridvectorlayers import GridVectorLayers
 from gridpropertiesdialog import GridPropertiesDialog
 
 
+# Whether QPolygonF can be filled through its data buffer; checked on first use.
+_bufferPolygons = None
+
+
+def _polygonF(xs, ys):
+    '''
+    Builds a QPolygonF from coordinate arrays, writing straight into its
+    point buffer where the bindings allow it.
+    '''
+    global _bufferPolygons
+
+    count = len(xs)
+
+    if _bufferPolygons is None:
+        _bufferPolygons = _canBufferPolygons()
+
+    if _bufferPolygons:
+        polyline = QtGui.QPolygonF(count)
+        if count > 0:
+            buf = _polygonBuffer(polyline, count)
+            buf[0::2] = xs
+            buf[1::2] = ys
+        return polyline
+
+    polyline = QtGui.QPolygonF()
+    for x, y in zip(xs, ys):
+        polyline.append(QtCore.QPointF(x, y))
+    return polyline
+
+
+def _polygonBuffer(polyline, count):
+    ptr = polyline.data()
+    ptr.setsize(count * 2 * numpy.dtype(numpy.float64).itemsize)
+    return numpy.frombuffer(ptr, dtype=numpy.float64)
+
+
+def _canBufferPolygons():
+    # qreal is a float on some platforms, and older sip.voidptr objects don't
+    # expose the buffer interface. Four points leave room for two doubles
+    # even when qreal is a float.
+    try:
+        polyline = QtGui.QPolygonF(4)
+        buf = _polygonBuffer(polyline, 2)
+        buf[:] = (1.0, 2.0, 3.0, 4.0)
+    except (AttributeError, TypeError, ValueError):
+        return False
+
+    return polyline.at(1) == QtCore.QPointF(3.0, 4.0)
+
+
+def _readAttribute(element, name, kind, default):
+    '''
+    Returns an XML attribute as an int, float or bool, or default if it is
+    missing or malformed.
+    '''
+    if not element.hasAttribute(name):
+        return default
+
+    text = unicode(element.attribute(name)).strip()
+
+    try:
+        if kind is bool:
+            return _parseBool(text)
+        return kind(text)
+    except ValueError:
+        return default
+
+
+def _parseBool(text):
+    # Also reads the 'True' and 'False' saved before grid_version 1.
+    value = text.lower()
+
+    if value in ('1', 'true'):
+        return True
+    elif value in ('0', 'false'):
+        return False
+
+    raise ValueError('Not a boolean: {0}'.format(text))
+
+
+def _formatAttribute(value, kind):
+    if kind is bool:
+        return '1' if value else '0'
+    elif kind is float:
+        # repr() keeps every digit, unlike str().
+        return repr(float(value))
+
+    return str(kind(value))
+
+
+def _tileContext(renderContext, painter):
+    '''Returns a copy of renderContext's settings that paints with painter.'''
+    context = core.QgsRenderContext()
+    context.setPainter(painter)
+    context.setMapToPixel(renderContext.mapToPixel())
+    context.setExtent(renderContext.extent())
+    context.setScaleFactor(renderContext.scaleFactor())
+    context.setRasterScaleFactor(renderContext.rasterScaleFactor())
+    context.setRendererScale(renderContext.rendererScale())
+    return context
+
+
+def _reproject(xform, xs, ys, direction=core.QgsCoordinateTransform.ForwardTransform):
+    '''Transforms coordinate arrays of any shape point by point.'''
+    outXs = numpy.empty_like(xs)
+    outYs = numpy.empty_like(ys)
+
+    for i, (x, y) in enumerate(zip(xs.flat, ys.flat)):
+        p = xform.transform(core.QgsPoint(x, y), direction)
+        outXs.flat[i] = p.x()
+        outYs.flat[i] = p.y()
+
+    return outXs, outYs
+
+
+def _inside(points, view):
+    '''
+    Returns the indices of the points inside view, or of all of them if view
+    is None.
+    '''
+    xs, ys = points
+
+    if view is None:
+        return numpy.arange(len(xs))
+
+    xmin, ymin, xmax, ymax = view
+    return numpy.nonzero((xs >= xmin) & (xs <= xmax) & (ys >= ymin) & (ys <= ymax))[0]
+
+
+def _stride(spacing, minimum):
+    '''
+    Returns the smallest of 1, 2, 5, 10, 20, 50... lines that are at least
+    minimum apart, given the spacing of adjacent lines.
+    '''
+    if spacing <= 0.0:
+        return 1
+
+    decade = 1
+    while True:
+        for step in (1, 2, 5):
+            if spacing * step * decade >= minimum:
+                return step * decade
+
+        decade *= 10
+
+
+class Subgrid(object):
+    '''
+    A level of a hierarchical grid, dividing each cell of the level above
+    it into divisionsX by divisionsY cells. It has its own symbol, and its
+    own labels if draw_labels is set, and is only drawn once its cells are
+    at least minSpacing pixels apart.
+    '''
+
+    def __init__(self, divisionsX=10, divisionsY=10, symbol=None, minSpacing=8.0, draw_labels=False):
+        self.divisionsX = divisionsX
+        self.divisionsY = divisionsY
+        self.minSpacing = minSpacing
+        self.draw_labels = draw_labels
+
+        if symbol is None:
+            symbol = core.QgsLineSymbolV2.createSimple({'width':'0', 'color':'0,160,0'})
+        self.symbol = symbol
+
+
 class GridPluginLayer(core.QgsPluginLayer):
     LAYER_TYPE = 'grid'
 
+    # Number of grid vertices in each reprojected line chunk.
+    CHUNK_SIZE = 256
+    # Number of reprojected line chunks kept, per scale when densified. The
+    # caches are sized to hold every chunk of the last view drawn if it has
+    # more, as a view that doesn't fit would miss on every chunk of every
+    # redraw.
+    PROJECTED_CACHE_SIZE = 2048
+    # Maximum distance, in pixels, between a reprojected line and its curve.
+    DENSIFY_TOLERANCE = 0.5
+    # Number of scale buckets of densified lines to keep.
+    DENSIFY_CACHE_SIZE = 4
+    # Points sampled along each edge for the extent in project CRS, and the
+    # accuracy of that extent as a fraction of its size.
+    EXTENT_SAMPLES = 32
+    EXTENT_TOLERANCE = 1e-4
+    # Number of label features kept between renders.
+    LABEL_CACHE_SIZE = 4096
+    # Most labels drawn in one render. Labels that would overlap are dropped,
+    # their sizes estimated with LABEL_CHAR_WIDTH, the average width of a
+    # character relative to the text height, and LABEL_SPACING pixels apart.
+    MAX_LABELS = 2000
+    LABEL_CHAR_WIDTH = 0.6
+    LABEL_SPACING = 2.0
+    MM_PER_POINT = 0.3528
+    # Images with at least this many pixels, e.g. print exports, are
+    # rendered in tiles of TILE_SIZE pixels square on a pool of threads.
+    TILED_RENDER_PIXELS = 4000000
+    TILE_SIZE = 1024
+    # Smaller images, e.g. the canvas, are composed of CACHED_TILE_SIZE pixel
+    # tiles, the last TILE_CACHE_BYTES worth of which are kept for revisiting
+    # in a cache shared by all grid layers. With the GridOverlay/tileCacheDir
+    # setting, up to TILE_SPILL_SIZE more are kept on disk there.
+    CACHED_TILE_SIZE = 256
+    TILE_CACHE_BYTES = 32 * 1024 * 1024
+    TILE_SPILL_SIZE = 4096
+    _sharedTileCache = None
+
+    # Properties that each generation stage depends on. See updateGrid.
+    GEOMETRY_PROPERTIES = ('origin', 'numCellsX', 'numCellsY', 'gridOffsetX', 'gridOffsetY',
+                           'cellSizeX', 'cellSizeY', 'baselineAngle')
+    LABEL_TEXT_PROPERTIES = ('label_type', 'label_precision', 'label_format', 'label_hemisphere',
+                             'label_leading_zeros', 'label_degrees_diff')
+    LABEL_ATTRIBUTE_PROPERTIES = ('label_orientation', 'label_xoff_horizontal', 'label_xoff_vertical',
+                                  'label_yoff_horizontal', 'label_yoff_vertical')
+    # Set STATISTICS_VARIABLE in the environment to log the time spent in each
+    # stage after every render, and PROFILE_VARIABLE to a file name to save a
+    # cProfile capture of the next render there.
+    STATISTICS_VARIABLE = 'GRIDOVERLAY_STATS'
+    PROFILE_VARIABLE = 'GRIDOVERLAY_PROFILE'
+
+    # Version of the saved properties, and the (attribute, property, type) of
+    # those on the layer element and on its label element. See readXml.
+    XML_VERSION = 1
+    LAYER_ATTRIBUTES = (('num_cells_x', 'numCellsX', int),
+                        ('num_cells_y', 'numCellsY', int),
+                        ('grid_offset_x', 'gridOffsetX', int),
+                        ('grid_offset_y', 'gridOffsetY', int),
+                        ('cell_size_x', 'cellSizeX', float),
+                        ('cell_size_y', 'cellSizeY', float),
+                        ('baseline_angle', 'baselineAngle', float),
+                        ('min_line_spacing', 'minLineSpacing', float))
+    LABEL_ATTRIBUTES = (('draw_labels', 'draw_labels', bool),
+                        ('type', 'label_type', int),
+                        ('precision', 'label_precision', int),
+                        ('orientation', 'label_orientation', int),
+                        ('format', 'label_format', int),
+                        ('hemisphere', 'label_hemisphere', bool),
+                        ('xoff_horizontal', 'label_xoff_horizontal', float),
+                        ('xoff_vertical', 'label_xoff_vertical', float),
+                        ('yoff_horizontal', 'label_yoff_horizontal', float),
+                        ('yoff_vertical', 'label_yoff_vertical', float),
+                        ('leading_zeros', 'label_leading_zeros', bool),
+                        ('degrees_diff', 'label_degrees_diff', bool))
+    # Those of each subgrid element.
+    SUBGRID_ATTRIBUTES = (('divisions_x', 'divisionsX', int),
+                          ('divisions_y', 'divisionsY', int),
+                          ('min_spacing', 'minSpacing', float),
+                          ('draw_labels', 'draw_labels', bool))
+
     _featuremap = {
         0: core.QgsField('cell_num', QtCore.QVariant.Int, 'integer', 8),
         1: core.QgsField('angle', QtCore.QVariant.Double, 'double', 8, 4),
@@ -57,9 +311,25 @@ class GridPluginLayer(core.QgsPluginLayer):
         self.cellSizeX = 10.0
         self.cellSizeY = 10.0
         self.baselineAngle = 0.0
-        self.grid = []
+        self.minLineSpacing = 2.0
+        self.grid = None
+        self.subgrids = []
+        self._levelGrids = {}
+        self._xform = None
+        self._xformKey = None
+        self._projected = LRUCache(GridPluginLayer.PROJECTED_CACHE_SIZE)
+        self._densified = LRUCache(GridPluginLayer.DENSIFY_CACHE_SIZE)
+        self._projectedExtents = {}
+        self._viewChunks = set()
+        self.tileCache = GridPluginLayer.sharedTileCache()
         self.label = core.QgsLabel(GridPluginLayer._featuremap)
-        self.label_features = []
+        self._labelCache = LRUCache(GridPluginLayer.LABEL_CACHE_SIZE)
+        self._labelFormatters = {}
+        self._generated = {}
+        self.vectorLayers = None
+        self.statistics = Statistics(bool(os.environ.get(GridPluginLayer.STATISTICS_VARIABLE)))
+        self.logStatistics = self.statistics.enabled
+        self._profilePath = os.environ.get(GridPluginLayer.PROFILE_VARIABLE) or None
         self.draw_labels = False
         self.label_type = 0
         self.label_precision = 0
@@ -72,6 +342,7 @@ class GridPluginLayer(core.QgsPluginLayer):
         self.label_xoff_vertical = 0.0
         self.label_yoff_horizontal = 0.0
         self.label_yoff_vertical = 0.0
+        core.QgsMapLayerRegistry.instance().layerWillBeRemoved.connect(self._layerWillBeRemoved)
 
         proj = core.QgsProject.instance()
         # Default CRS: 3452 == EPSG:4326
@@ -82,179 +353,1024 @@ class GridPluginLayer(core.QgsPluginLayer):
         self.setCrs(crs)
 
     def draw(self, renderContext):
-        mapToPixel = renderContext.mapToPixel()
+        if self._profilePath is not None:
+            path, self._profilePath = self._profilePath, None
+            profile = cProfile.Profile()
+            result = profile.runcall(self._draw, renderContext)
+            profile.dump_stats(path)
+            return result
+
+        with self.statistics.timer('draw'):
+            result = self._draw(renderContext)
+
+        if self.logStatistics:
+            self._logStatistics()
+
+        return result
+
+    def setStatisticsEnabled(self, enabled, log=False):
+        '''
+        Starts or stops recording the timers and counters in statistics,
+        optionally logging and resetting them after every render.
+        '''
+        self.statistics.enabled = enabled
+        self.logStatistics = enabled and log
+
+    def resetStatistics(self):
+        self.statistics.reset()
+
+    def _logStatistics(self):
+        report = self.statistics.report()
+        self.statistics.reset()
+
+        # The message log is new in QGIS 1.8.
+        if hasattr(core, 'QgsMessageLog'):
+            core.QgsMessageLog.logMessage(report, 'Grid overlay')
+
+    def _draw(self, renderContext):
+        if self.grid is None or self.vectorLayers is not None or not self._overlaps(renderContext.extent()):
+            return True
+
+        extent = renderContext.extent()
+        toPixel = AffineTransform.fromMapToPixel(renderContext.mapToPixel(),
+                                                 extent.xMinimum(), extent.yMinimum(),
+                                                 extent.width(), extent.height())
+        xform = self._transform()
+        densified = self._densifiedChunks(renderContext.mapToPixel().mapUnitsPerPixel())
+        view = self._layerView(extent, xform)
+        levels = self._visibleLevels(renderContext, view)
+        self._viewChunks.clear()
+
+        if self._renderInTiles(renderContext):
+            lines = [(polyline, bounds, level) for level, strides in levels
+                     for polyline, bounds in self._pixelLines(self._spansIn(view, strides, level), strides,
+                                                              xform, densified, toPixel, level)]
+            self._renderTiles(renderContext, lines)
+        elif self.tileCache is not None and canRenderTiles(renderContext.painter()):
+            self._drawCachedTiles(renderContext, xform, densified, toPixel, levels)
+        else:
+            symbols = self._levelSymbols()
+
+            for level, strides in levels:
+                spans = self._spansIn(view, strides, level)
+                symbols[level].startRender(renderContext)
+
+                for polyline, bounds in self._pixelLines(spans, strides, xform, densified, toPixel, level):
+                    # Each line is rendered once, after all of its vertices are in.
+                    self._renderPolyline(polyline, renderContext, symbols[level])
+
+                symbols[level].stopRender(renderContext)
+
+        self._fitChunkCaches(densified, trim=True)
+        return True
+
+    def _pixelLines(self, spans, strides, xform, densified, toPixel, level=0):
+        '''
+        Yields a QPolygonF in pixels and its (xmin, ymin, xmax, ymax) bounds
+        for each span of a level drawn at strides.
+        '''
+        rowStride, colStride = strides
+
+        for axis, line, first, last in spans:
+            with self.statistics.timer('transform'):
+                lineXs, lineYs = self._projectedSpan(xform, densified, axis, line, first, last, level,
+                                                     colStride if axis == HORIZONTAL else rowStride)
+                pixelXs, pixelYs = toPixel.apply(lineXs, lineYs)
+
+            yield (_polygonF(pixelXs, pixelYs),
+                   (pixelXs.min(), pixelYs.min(), pixelXs.max(), pixelYs.max()))
+
+    def _renderInTiles(self, renderContext):
+        painter = renderContext.painter()
+        device = painter.device()
+
+        return (QtCore.QThread.idealThreadCount() >= 4 and canRenderTiles(painter)
+                and device.width() * device.height() >= GridPluginLayer.TILED_RENDER_PIXELS)
+
+    def _renderTiles(self, renderContext, lines):
+        '''
+        Strokes (polyline, bounds, level) lines on a pool of threads, each
+        tile with its own copies of the symbols and render context.
+        '''
+        def render(painter, tilePolylines):
+            context = _tileContext(renderContext, painter)
+            symbols = [symbol.clone() for symbol in self._levelSymbols()]
+            for symbol in symbols:
+                symbol.startRender(context)
+            for polyline, level in tilePolylines:
+                self._renderPolyline(polyline, context, symbols[level])
+            for symbol in symbols:
+                symbol.stopRender(context)
+
+        polylines = [(polyline, level) for polyline, bounds, level in lines]
+        bounds = [bounds for polyline, bounds, level in lines]
+        renderTiles(renderContext.painter(), polylines, bounds, render,
+                    GridPluginLayer.TILE_SIZE, self._strokeMargin(renderContext))
+
+    def _strokeMargin(self, renderContext):
+        '''Returns how far, in pixels, strokes can reach beyond their vertices.'''
+        pixelsPerMM = renderContext.scaleFactor() * renderContext.rasterScaleFactor()
+        # Allow for caps and joins.
+        return 2.0 * max(symbol.width() for symbol in self._levelSymbols()) * pixelsPerMM + 2.0
 
+    def _drawCachedTiles(self, renderContext, xform, densified, toPixel, levels):
+        '''
+        Draws the view from pixel-aligned tiles, rendering only those missing
+        from the tile cache.
+        '''
+        painter = renderContext.painter()
+        device = painter.device()
+        extent = renderContext.extent()
+        mapUnitsPerPixel = renderContext.mapToPixel().mapUnitsPerPixel()
+        size = GridPluginLayer.CACHED_TILE_SIZE
+
+        if mapUnitsPerPixel <= 0.0:
+            return
+
+        margin = self._strokeMargin(renderContext)
+
+        # The view's top left corner in pixels from the map origin. Panning by
+        # whole pixels keeps the fractions, and so the tiles, the same.
+        worldX = extent.xMinimum() / mapUnitsPerPixel
+        worldY = -extent.yMaximum() / mapUnitsPerPixel
+        baseX = int(math.floor(worldX))
+        baseY = int(math.floor(worldY))
+        viewKey = (self._tileStateKey(renderContext), '%.12g' % mapUnitsPerPixel,
+                   '%.4f' % (worldX - baseX), '%.4f' % (worldY - baseY), tuple(levels), margin)
+
+        for j in xrange(baseY // size, (baseY + device.height() - 1) // size + 1):
+            for i in xrange(baseX // size, (baseX + device.width() - 1) // size + 1):
+                left = i * size - baseX
+                top = j * size - baseY
+                tileExtent = core.QgsRectangle(extent.xMinimum() + (left - margin) * mapUnitsPerPixel,
+                                               extent.yMaximum() - (top + size + margin) * mapUnitsPerPixel,
+                                               extent.xMinimum() + (left + size + margin) * mapUnitsPerPixel,
+                                               extent.yMaximum() - (top - margin) * mapUnitsPerPixel)
+                tileView = self._layerView(tileExtent, xform)
+                spans = [(level, strides, list(self._spansIn(tileView, strides, level)))
+                         for level, strides in levels]
+
+                if not any(levelSpans for level, strides, levelSpans in spans):
+                    continue
+
+                key = TileCache.digest(viewKey + (i, j, spans))
+                tile = self.tileCache.get(key)
+
+                if tile is not None:
+                    self.statistics.count('tile cache hits')
+                else:
+                    self.statistics.count('tile cache misses')
+                    tile = self._renderCachedTile(renderContext, xform, densified, toPixel,
+                                                  spans, left, top, size)
+                    self.tileCache[key] = tile
+
+                painter.drawImage(left, top, tile)
+
+    def _tileStateKey(self, renderContext):
+        '''Returns everything but the line spans that a cached tile's pixels depend on.'''
+        doc = QtXml.QDomDocument()
+        for symbol in self._levelSymbols():
+            doc.appendChild(core.QgsSymbolLayerV2Utils.saveSymbol('grid_lines', symbol, doc, None))
+
+        return ((self.grid.originX, self.grid.originY,
+                 self.grid.baseVec.x, self.grid.baseVec.y, self.grid.perpVec.x, self.grid.perpVec.y,
+                 self.grid.offsetX, self.grid.offsetY),
+                tuple((subgrid.divisionsX, subgrid.divisionsY) for subgrid in self.subgrids),
+                unicode(doc.toString()), self._xformKey, GridPluginLayer.DENSIFY_TOLERANCE,
+                renderContext.scaleFactor(), renderContext.rasterScaleFactor(),
+                int(renderContext.painter().renderHints()))
+
+    def _renderCachedTile(self, renderContext, xform, densified, toPixel, spans, left, top, size):
+        tile = QtGui.QImage(size, size, QtGui.QImage.Format_ARGB32_Premultiplied)
+        tile.fill(0)
+
+        painter = QtGui.QPainter(tile)
+        painter.setRenderHints(renderContext.painter().renderHints())
+        painter.translate(-left, -top)
+        context = _tileContext(renderContext, painter)
+        symbols = self._levelSymbols()
+
+        for level, strides, levelSpans in spans:
+            symbols[level].startRender(context)
+            for polyline, bounds in self._pixelLines(levelSpans, strides, xform, densified, toPixel, level):
+                self._renderPolyline(polyline, context, symbols[level])
+            symbols[level].stopRender(context)
+
+        painter.end()
+        return tile
+
+    def _transform(self):
+        '''
+        Returns the layer to project CRS transform, rebuilding it only when
+        either CRS has changed.
+        '''
         proj = core.QgsProject.instance()
         # Default CRS: 3452 == EPSG:4326
         srid = proj.readNumEntry('SpatialRefSys', '/ProjectCRSID', 3452)[0]
-        crs = core.QgsCoordinateReferenceSystem(srid, core.QgsCoordinateReferenceSystem.InternalCrsId)
+        key = (self.crs().srsid(), srid)
 
-        xform = core.QgsCoordinateTransform(self.crs(), crs)
+        if key != self._xformKey:
+            crs = core.QgsCoordinateReferenceSystem(srid, core.QgsCoordinateReferenceSystem.InternalCrsId)
+            self._xform = core.QgsCoordinateTransform(self.crs(), crs)
+            self._xformKey = key
+            self._projected.clear()
+            self._densified.clear()
 
-        self.symbol.startRender(renderContext)
+        return self._xform
 
-        for line in self.grid:
-            polyline = QtGui.QPolygonF()
+    def projectedExtent(self):
+        '''
+        Returns the grid's extent in project CRS as (xmin, ymin, xmax, ymax),
+        from its densified boundary, or None if it can't be projected.
+        '''
+        if self.grid is None:
+            return None
 
-            for vertex in line:
-                end = mapToPixel.transform(xform.transform(vertex))
-                polyline.append(QtCore.QPointF(end.x(), end.y()))
+        xform = self._transform()
 
-                if QGis.QGIS_VERSION_INT < 10800:
-                    self.symbol.renderPolyline(polyline, renderContext)
-                else:
-                    self.symbol.renderPolyline(polyline, None, renderContext)
+        if self._isIdentityTransform():
+            return self.grid.extent
 
-        self.symbol.stopRender(renderContext)
-        return True
+        if self._xformKey not in self._projectedExtents:
+            xs, ys = self.grid.boundary(GridPluginLayer.EXTENT_SAMPLES)
+            project = lambda x, y: _reproject(xform, x, y)
+
+            try:
+                pxs, pys = project(xs, ys)
+                extent = pointsExtent(pxs, pys)
+
+                if extent is not None:
+                    tolerance = GridPluginLayer.EXTENT_TOLERANCE * max(extent[2] - extent[0],
+                                                                       extent[3] - extent[1])
+                    pxs, pys, starts = densifyLine(project, xs, ys, pxs, pys, tolerance)
+                    extent = pointsExtent(pxs, pys)
+            except Exception:
+                extent = None
+
+            self._projectedExtents[self._xformKey] = extent
+
+        return self._projectedExtents[self._xformKey]
+
+    def _overlaps(self, extent):
+        '''Returns whether the grid may be in a view extent in project CRS.'''
+        projected = self.projectedExtent()
+
+        if projected is None:
+            return True
+
+        xmin, ymin, xmax, ymax = projected
+        return (xmin <= extent.xMaximum() and xmax >= extent.xMinimum() and
+                ymin <= extent.yMaximum() and ymax >= extent.yMinimum())
+
+    def _isIdentityTransform(self):
+        return self._xformKey[0] == self._xformKey[1]
+
+    def _projectedSpan(self, xform, densified, axis, line, first, last, level=0, step=1):
+        '''
+        Returns the points of a span of a line of a level in project CRS,
+        sampled every step lines and densified if densified is not None.
+        '''
+        if self._isIdentityTransform():
+            # A straight line needs only its ends.
+            return self._levelGrid(level).linePoints(axis, line, numpy.array([first, last]))
+
+        length = GridPluginLayer.CHUNK_SIZE * step
+        pieceXs = []
+        pieceYs = []
+        chunks = xrange(first // length, (last - 1) // length + 1)
+        self._viewChunks.update((level, axis, line, step, chunk) for chunk in chunks)
+        self._fitChunkCaches(densified)
+
+        for chunk in chunks:
+            xs, ys, starts, positions = self._projectedChunk(xform, densified, axis, line, chunk, level, step)
+            # From the last sample at or before first to the first at or after last.
+            lo = starts[max(numpy.searchsorted(positions, first, 'right') - 1, 0)]
+            hi = starts[min(numpy.searchsorted(positions, last), len(positions) - 1)]
+
+            # Neighbouring chunks share their end point.
+            if pieceXs:
+                lo += 1
+
+            pieceXs.append(xs[lo:hi + 1])
+            pieceYs.append(ys[lo:hi + 1])
+
+        return numpy.concatenate(pieceXs), numpy.concatenate(pieceYs)
+
+    def _projectedChunk(self, xform, densified, axis, line, chunk, level=0, step=1):
+        '''Returns the (xs, ys, starts, positions) of a reprojected line chunk.'''
+        key = (level, axis, line, step, chunk)
+        cache = self._projected if densified is None else densified[1]
+        result = cache.get(key)
+
+        if result is not None:
+            self.statistics.count('projected chunk cache hits')
+        else:
+            grid = self._levelGrid(level)
+
+            if densified is None:
+                positions = self._chunkSamples(grid, axis, chunk, step)
+                xs, ys = grid.linePoints(axis, line, positions)
+                self.statistics.count('vertices transformed', len(xs))
+                pxs, pys = _reproject(xform, xs, ys)
+                result = (pxs, pys, numpy.arange(len(pxs)), positions)
+            else:
+                pxs, pys, starts, positions = self._projectedChunk(xform, None, axis, line, chunk, level, step)
+                xs, ys = grid.linePoints(axis, line, positions)
+                result = densifyLine(lambda x, y: _reproject(xform, x, y),
+                                     xs, ys, pxs, pys, densified[0]) + (positions,)
+                self.statistics.count('vertices added by densifying', len(result[0]) - len(xs))
+
+            cache[key] = result
+
+        return result
+
+    def _chunkSamples(self, grid, axis, chunk, step):
+        '''
+        Returns the positions along a line of the samples of a chunk: its ends
+        and the vertices on the lines across it that are drawn every step.
+        '''
+        length = GridPluginLayer.CHUNK_SIZE * step
+        start = chunk * length
+        end = min(start + length, (grid.numCols if axis == HORIZONTAL else grid.numRows) - 1)
+        offset = grid.offsetX if axis == HORIZONTAL else grid.offsetY
+        onStride = numpy.arange(start + (-(start + offset)) % step, end + 1, step)
+        return numpy.union1d(onStride, (start, end))
+
+    def _fitChunkCaches(self, densified, trim=False):
+        '''
+        Grows the chunk caches to hold the chunks used by the current render,
+        or with trim, shrinks them back once it's done.
+        '''
+        floor = GridPluginLayer.PROJECTED_CACHE_SIZE
+        size = max(len(self._viewChunks), floor)
+
+        if not trim:
+            for cache in [self._projected] if densified is None else [self._projected, densified[1]]:
+                cache.maxSize = max(cache.maxSize, size)
+            return
+
+        self._projected.resize(size)
+        for key, (tolerance, cache) in self._densified.items():
+            cache.resize(size if densified is not None and cache is densified[1] else floor)
+
+    def _densifiedChunks(self, mapUnitsPerPixel):
+        '''
+        Returns the (tolerance, cache) of densified line chunks for the current
+        scale, or None if the grid is drawn in its own CRS.
+        '''
+        if self._isIdentityTransform() or mapUnitsPerPixel <= 0.0:
+            return None
+
+        bucket = int(math.floor(math.log(mapUnitsPerPixel, 2)))
+        key = (self._xformKey, bucket)
+
+        densified = self._densified.get(key)
+
+        if densified is None:
+            densified = (GridPluginLayer.DENSIFY_TOLERANCE * 2.0 ** bucket,
+                         LRUCache(GridPluginLayer.PROJECTED_CACHE_SIZE))
+            self._densified[key] = densified
+
+        return densified
+
+    def _layerView(self, extent, xform):
+        '''
+        Returns a view extent in layer CRS as (xmin, ymin, xmax, ymax), or
+        None if it can't be projected back into the layer CRS.
+        '''
+        if self._isIdentityTransform():
+            view = extent
+        else:
+            try:
+                view = xform.transformBoundingBox(extent, core.QgsCoordinateTransform.ReverseTransform)
+            except Exception:
+                return None
+
+        return view.xMinimum(), view.yMinimum(), view.xMaximum(), view.yMaximum()
+
+    def _spansIn(self, view, strides, level=0):
+        '''
+        Returns the spans of a level's lines within a view extent in layer CRS,
+        thinned to strides.
+        '''
+        grid = self._levelGrid(level)
+        rowStride, colStride = strides
+
+        if view is None:
+            # Draw everything and let the renderer clip.
+            spans = grid.lineSpans(rowStride, colStride)
+        else:
+            spans = grid.visibleLineSpans(*view, rowStride=rowStride, colStride=colStride)
+
+        if level == 0:
+            return spans
+
+        subgrid = self.subgrids[level - 1]
+        return (span for span in spans
+                if not grid.onStride(span[0], span[1],
+                                     subgrid.divisionsY if span[0] == HORIZONTAL else subgrid.divisionsX))
+
+    def _layerUnitsPerPixel(self, renderContext, view):
+        '''
+        Returns the layer CRS units per pixel, averaged over the view, or
+        None if it isn't known.
+        '''
+        extent = renderContext.extent()
+        mapUnitsPerPixel = renderContext.mapToPixel().mapUnitsPerPixel()
+
+        if view is None or extent.width() <= 0.0 or mapUnitsPerPixel <= 0.0:
+            return None
+
+        layerUnitsPerPixel = (view[2] - view[0]) * mapUnitsPerPixel / extent.width()
+        return layerUnitsPerPixel if layerUnitsPerPixel > 0.0 else None
+
+    def _levelOfDetail(self, renderContext, view, level=0):
+        '''
+        Returns the (rowStride, colStride) that keeps the drawn lines of a
+        level at least minLineSpacing pixels apart.
+        '''
+        layerUnitsPerPixel = self._layerUnitsPerPixel(renderContext, view)
+
+        if self.minLineSpacing <= 0.0 or layerUnitsPerPixel is None:
+            return 1, 1
+
+        cellSizeX, cellSizeY = self._levelCellSize(level)
+        return (_stride(cellSizeY / layerUnitsPerPixel, self.minLineSpacing),
+                _stride(cellSizeX / layerUnitsPerPixel, self.minLineSpacing))
+
+    def _visibleLevels(self, renderContext, view):
+        '''Returns the (level, strides) of the levels to draw, finest first.'''
+        levels = [(0, self._levelOfDetail(renderContext, view))]
+        layerUnitsPerPixel = self._layerUnitsPerPixel(renderContext, view)
+
+        if layerUnitsPerPixel is not None:
+            for level, subgrid in enumerate(self.subgrids, 1):
+                if min(self._levelCellSize(level)) / layerUnitsPerPixel < subgrid.minSpacing:
+                    break
+                levels.insert(0, (level, self._levelOfDetail(renderContext, view, level)))
+
+        return levels
+
+    def _levelCellSize(self, level):
+        cellSizeX, cellSizeY = self.cellSizeX, self.cellSizeY
+
+        for subgrid in self.subgrids[:level]:
+            cellSizeX /= float(subgrid.divisionsX)
+            cellSizeY /= float(subgrid.divisionsY)
+
+        return cellSizeX, cellSizeY
+
+    def _levelGrid(self, level):
+        '''
+        Returns the geometry of a level, building a subgrid's from the level
+        above on first use.
+        '''
+        if level == 0:
+            return self.grid
+
+        grid = self._levelGrids.get(level)
+
+        if grid is None:
+            subgrid = self.subgrids[level - 1]
+            grid = self._levelGrid(level - 1).subdivide(subgrid.divisionsX, subgrid.divisionsY)
+            self._levelGrids[level] = grid
+            self.statistics.count('subgrids built')
+
+        return grid
+
+    def _levelSymbols(self):
+        return [self.symbol] + [subgrid.symbol for subgrid in self.subgrids]
+
+    def setSubgrids(self, subgrids):
+        '''
+        Replaces the subgrids with a list of Subgrid, from the coarsest to
+        the finest, each dividing the cells of the one before it.
+        '''
+        self.subgrids = [subgrid for subgrid in subgrids
+                         if subgrid.divisionsX >= 1 and subgrid.divisionsY >= 1]
+        self._clearLevels()
+
+        self.setCacheImage(None)
+        self.emit(QtCore.SIGNAL('repaintRequested()'))
+
+    def _clearLevels(self):
+        self._levelGrids.clear()
+        self._projected.clear()
+        self._densified.clear()
+        self._labelCache.clear()
+
+    def _renderPolyline(self, polyline, renderContext, symbol=None):
+        if symbol is None:
+            symbol = self.symbol
+
+        self.statistics.count('polylines rendered')
+
+        with self.statistics.timer('renderPolyline'):
+            if QGis.QGIS_VERSION_INT < 10800:
+                symbol.renderPolyline(polyline, renderContext)
+            else:
+                symbol.renderPolyline(polyline, None, renderContext)
 
     def drawLabels(self, renderContext):
-        if self.draw_labels:
-            for feat in self.label_features:
-                self.label.renderLabel(renderContext, feat, False)
+        labelled = [self.draw_labels] + [subgrid.draw_labels for subgrid in self.subgrids]
 
-    def generateGrid(self):
-        self.grid = []
+        if (any(labelled) and self.grid is not None and self.vectorLayers is None
+                and self._overlaps(renderContext.extent())):
+            with self.statistics.timer('drawLabels'):
+                xform = self._transform()
+                view = self._layerView(renderContext.extent(), xform)
+                textHeight = self._labelTextHeight(renderContext)
+                empty = numpy.zeros(0, dtype=int)
+                levels, firsts, seconds = [empty], [empty], [empty]
 
-        baseVec = QgsVector(1.0, 0.0).rotateBy(math.radians(360.0 - self.baselineAngle)) * self.cellSizeX
-        perpVec = baseVec.perpVector().normal() * self.cellSizeY
+                # The coarser levels' labels are placed first.
+                for level, strides in reversed(self._visibleLevels(renderContext, view)):
+                    if labelled[level]:
+                        rowStride, colStride = self._labelStrides(renderContext, view, strides, textHeight, level)
+                        first, second = self._visibleLabelCells(view, rowStride, colStride, level)
+                        levels.append(numpy.repeat(level, len(first)))
+                        firsts.append(first)
+                        seconds.append(second)
 
-        # Generate horizontal lines as a piecewise curve.
-        for h in xrange(self.gridOffsetY, self.numCellsY + self.gridOffsetY + 1):
-            line = []
+                for feat in self._placeLabels(renderContext, xform, textHeight, numpy.concatenate(levels),
+                                              numpy.concatenate(firsts), numpy.concatenate(seconds)):
+                    self.label.renderLabel(renderContext, feat, False)
+                    self.statistics.count('labels rendered')
 
-            for l in xrange(self.gridOffsetX, self.numCellsX + self.gridOffsetX + 1):
-                bar = (perpVec * h) + (baseVec * l)
-                line.append(core.QgsPoint(self.origin.x() + bar.x, self.origin.y() + bar.y))
+    def _labelTextHeight(self, renderContext):
+        '''Returns the height of the label text in pixels.'''
+        return max(self.label.labelAttributes().size() * GridPluginLayer.MM_PER_POINT *
+                   renderContext.scaleFactor() * renderContext.rasterScaleFactor(), 1.0)
 
-            self.grid.append(line)
+    def _labelStrides(self, renderContext, view, strides, textHeight, level=0):
+        '''
+        Returns the (rowStride, colStride) that keep a level's labels at least
+        textHeight pixels apart.
+        '''
+        layerUnitsPerPixel = self._layerUnitsPerPixel(renderContext, view)
+        rowStride, colStride = strides
 
-        # Generate vertical lines as a piecewise curve.
-        for v in xrange(self.gridOffsetX, self.numCellsX + self.gridOffsetX + 1):
-            line = []
+        if layerUnitsPerPixel is None:
+            return rowStride, colStride
 
-            for l in xrange(self.gridOffsetY, self.numCellsY + self.gridOffsetY + 1):
-                bar = (baseVec * v) + (perpVec * l)
-                line.append(core.QgsPoint(self.origin.x() + bar.x, self.origin.y() + bar.y))
+        cellSizeX, cellSizeY = self._levelCellSize(level)
+        return (rowStride * _stride(rowStride * cellSizeY / layerUnitsPerPixel, textHeight),
+                colStride * _stride(colStride * cellSizeX / layerUnitsPerPixel, textHeight))
 
-            self.grid.append(line)
+    def _placeLabels(self, renderContext, xform, textHeight, levels, first, second):
+        '''
+        Returns the features of the labels to draw, skipping those that would
+        overlap one already placed.
+        '''
+        if not len(levels):
+            return []
 
-        self.generateLabels()
-        
-        lower_left = (baseVec * self.gridOffsetX) + (perpVec * self.gridOffsetY)
-        lower_right = lower_left + (baseVec * self.numCellsX)
-        upper_left = lower_left + (perpVec * self.numCellsY)
-        upper_right = lower_right + (perpVec * self.numCellsY)
+        key = lambda i: (int(levels[i]), int(first[i]), int(second[i]))
 
-        minx = min(lower_left.x, min(lower_right.x, min(upper_left.x, upper_right.x)))
-        miny = min(lower_left.y, min(lower_right.y, min(upper_left.y, upper_right.y)))
-        maxx = max(lower_left.x, max(lower_right.x, max(upper_left.x, upper_right.x)))
-        maxy = max(lower_left.y, max(lower_right.y, max(upper_left.y, upper_right.y)))
+        try:
+            pxs, pys = self._labelAnchorPixels(renderContext, xform, levels, first, second)
+        except core.QgsCsException:
+            return [self._labelFeature(key(i)) for i in xrange(min(len(levels), GridPluginLayer.MAX_LABELS))]
+
+        device = renderContext.painter().device()
+        cols = int(math.ceil(device.width() / textHeight)) + 1
+        rows = int(math.ceil(device.height() / textHeight)) + 1
+
+        # Screen cells a text height square, one grid of them per axis: the
+        # labels of the first horizontal and vertical lines are aligned apart.
+        if self.label_type == 2:
+            layers = numpy.zeros(len(levels), dtype=int)
+        else:
+            layers = (first == VERTICAL).astype(int)
+        occupied = numpy.zeros((layers.max() + 1, rows, cols), dtype=bool)
+
+        cellXs = numpy.clip(numpy.floor(pxs / textHeight), 0, cols - 1).astype(int)
+        cellYs = numpy.clip(numpy.floor(pys / textHeight), 0, rows - 1).astype(int)
+        candidates = numpy.sort(numpy.unique((layers * rows + cellYs) * cols + cellXs, return_index=True)[1])
+        self.statistics.count('labels culled', len(levels) - len(candidates))
+
+        textIndex = 0 if self.label_type == 1 else 2
+        height = textHeight + GridPluginLayer.LABEL_SPACING
+        features = []
+
+        def box(layer, x, y, halfWidth, halfHeight):
+            left = max(int((x - halfWidth) // textHeight), 0)
+            right = min(int((x + halfWidth) // textHeight), cols - 1)
+            top = max(int((y - halfHeight) // textHeight), 0)
+            bottom = min(int((y + halfHeight) // textHeight), rows - 1)
+            return occupied[layer, top:bottom + 1, left:right + 1]
+
+        for i in candidates:
+            if len(features) == GridPluginLayer.MAX_LABELS:
+                break
+
+            # Every label covers at least a square of its height, so many can
+            # be culled before their features are built.
+            if box(layers[i], pxs[i], pys[i], height / 2.0, height / 2.0).any():
+                self.statistics.count('labels culled')
+                continue
+
+            feat = self._labelFeature(key(i))
+            attributes = feat.attributeMap()
+            width = (len(unicode(attributes[textIndex].toString())) * GridPluginLayer.LABEL_CHAR_WIDTH *
+                     textHeight + GridPluginLayer.LABEL_SPACING)
+            angle = math.radians(attributes[1].toDouble()[0])
+            labelBox = box(layers[i], pxs[i], pys[i],
+                           (abs(width * math.cos(angle)) + abs(height * math.sin(angle))) / 2.0,
+                           (abs(width * math.sin(angle)) + abs(height * math.cos(angle))) / 2.0)
+
+            if labelBox.any():
+                self.statistics.count('labels culled')
+                continue
+
+            labelBox[...] = True
+            features.append(feat)
+
+        return features
+
+    def _labelAnchorPixels(self, renderContext, xform, levels, first, second):
+        '''Returns the (xs, ys) in pixels of the anchors of the labels whose keys' parts are given.'''
+        xs = numpy.empty(len(levels))
+        ys = numpy.empty(len(levels))
+
+        for level in numpy.unique(levels):
+            mask = levels == level
+            xs[mask], ys[mask] = self._labelAnchors(self._levelGrid(int(level)), first[mask], second[mask])
+
+        if not self._isIdentityTransform():
+            xs, ys = _reproject(xform, xs, ys)
+
+        extent = renderContext.extent()
+        toPixel = AffineTransform.fromMapToPixel(renderContext.mapToPixel(),
+                                                 extent.xMinimum(), extent.yMinimum(),
+                                                 extent.width(), extent.height())
+        return toPixel.apply(xs, ys)
+
+    def _labelAnchors(self, grid, first, second):
+        '''Returns the (xs, ys) of the label anchors of a level's keys.'''
+        if self.label_type == 2:
+            return grid.cellCentre(first, second)
+
+        horizontal = first == HORIZONTAL
+        xs, ys = grid.vertices(numpy.where(horizontal, second, 0), numpy.where(horizontal, 0, second))
+
+        if self.label_type == 1:
+            # In the middle of the cell edge, as _cellLabel does.
+            xs = xs + numpy.where(horizontal, grid.baseVec.x, grid.perpVec.x) / 2.0
+            ys = ys + numpy.where(horizontal, grid.baseVec.y, grid.perpVec.y) / 2.0
+
+        return xs, ys
+
+    def updateGrid(self):
+        '''
+        Regenerates only the stages whose properties have changed since they
+        were last generated. Symbology changes need no regeneration at all.
+        '''
+        keys = self._stageKeys()
+
+        if keys['geometry'] != self._generated.get('geometry'):
+            self.generateGrid()
+        elif keys['labelText'] != self._generated.get('labelText'):
+            self.generateLabels()
+        elif keys['labelAttributes'] != self._generated.get('labelAttributes'):
+            self._updateLabelAttributes()
+
+    def _stageKeys(self):
+        '''Returns the values of the properties that each stage depends on.'''
+        return {'geometry': self._propertyValues(GridPluginLayer.GEOMETRY_PROPERTIES),
+                'labelText': self._propertyValues(GridPluginLayer.LABEL_TEXT_PROPERTIES) + (self.crs().geographicFlag(),),
+                'labelAttributes': self._propertyValues(GridPluginLayer.LABEL_ATTRIBUTE_PROPERTIES)}
+
+    def _propertyValues(self, names):
+        values = []
+
+        for name in names:
+            value = getattr(self, name)
+            if isinstance(value, core.QgsPoint):
+                value = (value.x(), value.y())
+            values.append(value)
+
+        return tuple(values)
+
+    def generateGrid(self):
+        self._generated['geometry'] = self._stageKeys()['geometry']
+        self.statistics.count('grids generated')
+        self._setGrid(buildGrid(core.QgsPoint(self.origin), self.cellSizeX, self.cellSizeY, self.baselineAngle,
+                                self.gridOffsetX, self.gridOffsetY, self.numCellsX, self.numCellsY))
+
+    def _setGrid(self, grid):
+        with self.statistics.timer('generateGrid'):
+            self.grid = grid
+            self._projected.clear()
+            self._densified.clear()
+            self._projectedExtents.clear()
+            self._levelGrids.clear()
+
+            self.generateLabels()
+
+            self.setExtent(core.QgsRectangle(*self.grid.extent))
+
+            if self.vectorLayers is not None:
+                self.vectorLayers.updateLines()
 
-        self.setExtent(core.QgsRectangle(minx + self.origin.x(), miny + self.origin.y(), maxx + self.origin.x(), maxy + self.origin.y()))
-        
     def generateLabels(self):
-        self.label_features = []
-        baseVec = QgsVector(1.0, 0.0).rotateBy(math.radians(360.0 - self.baselineAngle)) * self.cellSizeX
-        halfBaseVec = baseVec / 2.0
-        perpVec = baseVec.perpVector().normal() * self.cellSizeY
-        halfPerpVec = perpVec / 2.0
+        '''
+        Discards the cached label features. They are built lazily by
+        drawLabels, for the labels in view only.
+        '''
+        self.statistics.count('label generations')
+        self._labelCache.clear()
+
+        keys = self._stageKeys()
+        self._generated['labelText'] = keys['labelText']
+        self._generated['labelAttributes'] = keys['labelAttributes']
+
+        if self.vectorLayers is not None:
+            self.vectorLayers.updateLabels()
+
+    def _updateLabelAttributes(self):
+        '''
+        Re-applies the orientation and offsets to the cached label features,
+        keeping their text and geometry.
+        '''
+        if self.grid is None:
+            return
+
+        angle = math.degrees(self.grid.baseVec.angle())
+
+        for key, feat in self._labelCache.items():
+            if self.label_type != 2 and key[1] == VERTICAL:
+                self._setVerticalLabelAttributes(feat, angle)
+            else:
+                self._setHorizontalLabelAttributes(feat, angle)
+
+        self._generated['labelAttributes'] = self._stageKeys()['labelAttributes']
+
+        if self.vectorLayers is not None:
+            self.vectorLayers.updateLabels()
+
+    def _visibleLabelKeys(self, view, rowStride=1, colStride=1, level=0):
+        '''
+        Returns the keys of a level's labels whose anchors fall inside the
+        view, or of every label if view is None.
+        '''
+        first, second = self._visibleLabelCells(view, rowStride, colStride, level)
+        return [(level, int(a), int(b)) for a, b in zip(first, second)]
+
+    def _visibleLabelCells(self, view, rowStride=1, colStride=1, level=0):
+        '''
+        Returns the arrays of the last two parts of the keys of a level's labels
+        in view, or of every label if view is None.
+        '''
+        grid = self._levelGrid(level)
+        empty = numpy.zeros(0, dtype=int), numpy.zeros(0, dtype=int)
+
+        if self.label_type == 2:
+            # Grid reference - cell.
+            if view is None:
+                block = (0, grid.numCellsX - 1, 0, grid.numCellsY - 1)
+            else:
+                block = grid.cellBlock(*view)
+                if block is None:
+                    return empty
+
+            cols = numpy.arange(block[0], block[1] + 1)
+            rows = numpy.arange(block[2], block[3] + 1)
+            cols = cols[grid.onStride(VERTICAL, cols, colStride)]
+            rows = rows[grid.onStride(HORIZONTAL, rows, rowStride)]
+
+            cols, rows = numpy.meshgrid(cols, rows)
+            cols, rows = cols.ravel(), rows.ravel()
+            inside = _inside(grid.cellCentre(cols, rows), view)
+            return cols[inside], rows[inside]
+
+        # CRS coordinates sit on the vertices of the first horizontal and
+        # vertical lines, cell coordinates halfway between them. Labels along
+        # the first horizontal line belong to the vertical lines, and the
+        # other way round.
+        shift = 0.0 if self.label_type == 0 else 0.5
+        axes, cells = [empty[0]], [empty[1]]
+
+        for axis, count, lineAxis, stride in ((HORIZONTAL, grid.numCols, VERTICAL, colStride),
+                                              (VERTICAL, grid.numRows, HORIZONTAL, rowStride)):
+            if view is None:
+                lo, hi = 0.0, count - 1.0
+            else:
+                lo, hi = grid.clipLine(axis, 0, *view)
+                if lo > hi:
+                    continue
+
+            first = max(int(math.ceil(lo - shift)), 0)
+            last = min(int(math.floor(hi - shift)), count - 1 - int(math.ceil(shift)))
+            axisCells = numpy.arange(first, last + 1)
+            axisCells = axisCells[grid.onStride(lineAxis, axisCells, stride)]
+            axes.append(numpy.repeat(axis, len(axisCells)))
+            cells.append(axisCells)
+
+        return numpy.concatenate(axes), numpy.concatenate(cells)
+
+    def _labelFeature(self, key):
+        '''
+        Returns the label feature for a key from _visibleLabelKeys, building
+        it on a cache miss.
+        '''
+        feat = self._labelCache.get(key)
+
+        if feat is not None:
+            self.statistics.count('label cache hits')
+        else:
+            self.statistics.count('labels created')
+            feat = self._labelCache[key] = self._buildLabel(key)
+
+        return feat
+
+    def _buildLabel(self, key):
+        level, first, second = key
+        grid = self._levelGrid(level)
 
-        # CRS coordinates.
         if self.label_type == 0:
-            for cell in xrange(0, len(self.grid[0])):
-                feat = core.QgsFeature()
-                feat.addAttribute(0, cell)
-                self._setHorizontalLabelAttributes(feat, math.degrees(baseVec.angle()))
-
-                labelvalue = self.grid[0][cell].x()
-                if self.crs().geographicFlag():
-                    showDegrees = True
-                    
-                    if self.label_degrees_diff and cell > 0 and cell < len(self.grid[0]) - 1:
-                        if labelvalue < 0.0:
-                            lastLabelValue = self.grid[0][cell + 1].x()
-                        else:
-                            lastLabelValue = self.grid[0][cell - 1].x()
-                        
-                        if (abs(lastLabelValue) // 1 == abs(labelvalue) // 1) and ((lastLabelValue < 0.0) == (labelvalue < 0.0)):
-                            showDegrees = False
-                    
-                    labeltext = self.formatLabel(labelvalue, '%e', showDegrees)
-                else:
-                    labeltext = '{0:0.{precision}f}'.format(labelvalue, precision=self.label_precision)
-                    
-                feat.addAttribute(2, labeltext)
-                feat.setGeometry(core.QgsGeometry().fromPoint(self.grid[0][cell]))
-                self.label_features.append(feat)
-            
-            for cell in xrange(0, len(self.grid[self.numCellsY + 1])):
-                feat = core.QgsFeature()
-                feat.addAttribute(0, cell)
-                self._setVerticalLabelAttributes(feat, math.degrees(baseVec.angle()))
-
-                labelvalue = self.grid[self.numCellsY + 1][cell].y()
-                if self.crs().geographicFlag():
-                    showDegrees = True
-                    
-                    if self.label_degrees_diff and cell > 0 and cell < len(self.grid[self.numCellsY + 1]) - 1:
-                        if labelvalue < 0.0:
-                            lastLabelValue = self.grid[self.numCellsY + 1][cell + 1].y()
-                        else:
-                            lastLabelValue = self.grid[self.numCellsY + 1][cell - 1].y()
-                        
-                        if (abs(lastLabelValue) // 1 == abs(labelvalue) // 1) and ((lastLabelValue < 0.0) == (labelvalue < 0.0)):
-                            showDegrees = False
-                    
-                    labeltext = self.formatLabel(labelvalue, '%n', showDegrees)
+            return self._coordinateLabel(grid, first, second)
+        elif self.label_type == 1:
+            return self._cellLabel(grid, first, second)
+        else:
+            return self._referenceLabel(grid, first, second)
+
+    def _edgeVertex(self, grid, axis, cell):
+        '''Returns a vertex of the first horizontal or vertical line.'''
+        if axis == HORIZONTAL:
+            return grid.vertex(cell, 0)
+        else:
+            return grid.vertex(0, cell)
+
+    def _coordinateLabel(self, grid, axis, cell):
+        angle = math.degrees(grid.baseVec.angle())
+        feat = core.QgsFeature()
+        feat.addAttribute(0, cell)
+
+        if axis == HORIZONTAL:
+            self._setHorizontalLabelAttributes(feat, angle)
+            ordinate, count, hemisphere = 0, grid.numCols, '%e'
+        else:
+            self._setVerticalLabelAttributes(feat, angle)
+            ordinate, count, hemisphere = 1, grid.numRows, '%n'
+
+        point = self._edgeVertex(grid, axis, cell)
+        labelvalue = point[ordinate]
+        if self.crs().geographicFlag():
+            showDegrees = True
+
+            if self.label_degrees_diff and cell > 0 and cell < count - 1:
+                if labelvalue < 0.0:
+                    lastLabelValue = self._edgeVertex(grid, axis, cell + 1)[ordinate]
                 else:
-                    labeltext = '{0:0.{precision}f}'.format(labelvalue, precision=self.label_precision)
+                    lastLabelValue = self._edgeVertex(grid, axis, cell - 1)[ordinate]
 
-                feat.addAttribute(2, labeltext)
-                feat.setGeometry(core.QgsGeometry().fromPoint(self.grid[self.numCellsY + 1][cell]))
-                self.label_features.append(feat)
+                if (abs(lastLabelValue) // 1 == abs(labelvalue) // 1) and ((lastLabelValue < 0.0) == (labelvalue < 0.0)):
+                    showDegrees = False
 
-        elif self.label_type == 1:
-            # Cell coordinates.
-            for cell in xrange(0, len(self.grid[0]) - 1):
-                feat = core.QgsFeature()
-                feat.addAttribute(0, cell)
-                self._setHorizontalLabelAttributes(feat, math.degrees(baseVec.angle()))
-                
-                # Labels representing CRS coordinates are placed in the centre of the cell.
-                p = core.QgsPoint(self.grid[0][cell].x() + halfBaseVec.x, self.grid[0][cell].y() + halfBaseVec.y)
-                feat.setGeometry(core.QgsGeometry().fromPoint(p))
-            
-                self.label_features.append(feat)
-            
-            for cell in xrange(0, len(self.grid[self.numCellsY + 1]) - 1):
-                feat = core.QgsFeature()
-                feat.addAttribute(0, cell)
-                self._setVerticalLabelAttributes(feat, math.degrees(baseVec.angle()))
-                
-                p = core.QgsPoint(self.grid[self.numCellsY + 1][cell].x() + halfPerpVec.x, self.grid[self.numCellsY + 1][cell].y() + halfPerpVec.y)
-                feat.setGeometry(core.QgsGeometry().fromPoint(p))
-                
-                self.label_features.append(feat)
-
-        elif self.label_type == 2:
-            # Grid reference - cell.
-            for celly in xrange(0, len(self.grid[self.numCellsY + 1]) - 1):
-                for cellx in xrange(0, len(self.grid[0]) - 1):
-                    feat = core.QgsFeature()
-                    feat.addAttribute(0, (celly * len(self.grid[0])) + cellx)
-                    self._setHorizontalLabelAttributes(feat, math.degrees(baseVec.angle()))
-
-                    labeltext = u'{0} {1}'.format(cellx, celly)
-                    feat.addAttribute(2, labeltext)
-                    
-                    # Labels representing CRS coordinates are placed in the centre of the cell.
-                    px = core.QgsPoint(self.grid[0][cellx].x() + halfBaseVec.x, self.grid[0][cellx].y() + halfBaseVec.y)
-                    py = core.QgsPoint(self.grid[self.numCellsY + 1][celly].x() + halfPerpVec.x, self.grid[self.numCellsY + 1][celly].y() + halfPerpVec.y)
-                    pp = core.QgsPoint(px.x() + py.x(), px.y() + py.y())
-                    feat.setGeometry(core.QgsGeometry().fromPoint(pp))
-                
-                    self.label_features.append(feat)
+            labeltext = self.formatLabel(labelvalue, hemisphere, showDegrees)
+        else:
+            labeltext = '{0:0.{precision}f}'.format(labelvalue, precision=self.label_precision)
+
+        feat.addAttribute(2, labeltext)
+        feat.setGeometry(core.QgsGeometry().fromPoint(core.QgsPoint(*point)))
+        return feat
+
+    def _cellLabel(self, grid, axis, cell):
+        angle = math.degrees(grid.baseVec.angle())
+        feat = core.QgsFeature()
+        feat.addAttribute(0, cell)
+        x, y = self._edgeVertex(grid, axis, cell)
+
+        # Labels representing cell coordinates are placed in the middle of the cell edge.
+        if axis == HORIZONTAL:
+            self._setHorizontalLabelAttributes(feat, angle)
+            halfVec = grid.baseVec / 2.0
+        else:
+            self._setVerticalLabelAttributes(feat, angle)
+            halfVec = grid.perpVec / 2.0
+
+        feat.setGeometry(core.QgsGeometry().fromPoint(core.QgsPoint(x + halfVec.x, y + halfVec.y)))
+        return feat
+
+    def _referenceLabel(self, grid, cellx, celly):
+        feat = core.QgsFeature()
+        feat.addAttribute(0, (celly * (grid.numCellsX + 1)) + cellx)
+        self._setHorizontalLabelAttributes(feat, math.degrees(grid.baseVec.angle()))
+
+        feat.addAttribute(2, self.cellReferenceText(cellx, celly))
+
+        # Grid references are placed in the centre of the cell.
+        x, y = grid.cellCentre(cellx, celly)
+        feat.setGeometry(core.QgsGeometry().fromPoint(core.QgsPoint(float(x), float(y))))
+        return feat
+
+    def cellReferenceText(self, cellx, celly):
+        return u'{0} {1}'.format(cellx, celly)
+
+    def exportGrid(self, path, lines=True, cells=True):
+        '''
+        Writes the grid lines and cell polygons, with their cell references,
+        to a GeoPackage, Shapefile or GeoJSON file in layer CRS. Returns the
+        paths written.
+        '''
+        if self.grid is None:
+            raise ExportError('The grid has not been generated')
+
+        return exportGrid(self.grid, path, lines, cells, unicode(self.crs().toWkt()), self.cellReferenceText)
+
+    def setVectorLayersEnabled(self, enabled):
+        '''
+        Switches between drawing the grid here and exposing it as
+        GridVectorLayers in the map layer registry.
+        '''
+        registry = core.QgsMapLayerRegistry.instance()
+
+        if enabled and self.vectorLayers is None:
+            self.vectorLayers = GridVectorLayers(self)
+
+            for layer in self.vectorLayers.layers():
+                registry.addMapLayer(layer)
+        elif not enabled and self.vectorLayers is not None:
+            self._dropVectorLayers()
+        else:
+            return
+
+        self.setCacheImage(None)
+        self.emit(QtCore.SIGNAL('repaintRequested()'))
+
+    def _dropVectorLayers(self, removedId=None):
+        '''Removes the vector layers from the registry, except removedId.'''
+        registry = core.QgsMapLayerRegistry.instance()
+        layers, self.vectorLayers = self.vectorLayers.layers(), None
+
+        for layer in layers:
+            if layer.id() != removedId:
+                registry.removeMapLayer(layer.id())
+
+    def _layerWillBeRemoved(self, layerId):
+        if self.vectorLayers is not None:
+            ids = [layer.id() for layer in self.vectorLayers.layers()]
+
+            if layerId in ids or layerId == self.id():
+                self._dropVectorLayers(layerId)
+                self.setCacheImage(None)
+                self.emit(QtCore.SIGNAL('repaintRequested()'))
+
+        if layerId == self.id():
+            core.QgsMapLayerRegistry.instance().layerWillBeRemoved.disconnect(self._layerWillBeRemoved)
+
+    @staticmethod
+    def sharedTileCache():
+        '''Returns the tile cache shared by all grid layers, making it if need be.'''
+        if GridPluginLayer._sharedTileCache is None:
+            size = GridPluginLayer.CACHED_TILE_SIZE
+            spillDir = unicode(QtCore.QSettings().value('GridOverlay/tileCacheDir', '').toString())
+            GridPluginLayer._sharedTileCache = TileCache(GridPluginLayer.TILE_CACHE_BYTES // (size * size * 4),
+                                                         spillDir, GridPluginLayer.TILE_SPILL_SIZE)
+
+        return GridPluginLayer._sharedTileCache
+
+    @staticmethod
+    def releaseResources():
+        '''Deletes the shared tile cache's spilled tiles. Called when the plugin is unloaded.'''
+        if GridPluginLayer._sharedTileCache is not None:
+            GridPluginLayer._sharedTileCache.close()
+
+    def cellAt(self, point, projectCrs=False):
+        '''
+        Returns (cellx, celly, reference) for the cell containing a QgsPoint in
+        layer or project CRS, or None. Raises QgsCsException if untransformable.
+        '''
+        if self.grid is None:
+            return None
+
+        cellxs, cellys, inside = self.cellsAt(numpy.array([point.x()]), numpy.array([point.y()]), projectCrs)
+
+        if not inside[0]:
+            return None
+
+        cellx, celly = int(cellxs[0]), int(cellys[0])
+        return cellx, celly, self.cellReferenceText(cellx, celly)
+
+    def cellsAt(self, xs, ys, projectCrs=False):
+        '''
+        Batch form of cellAt, returning (cellxs, cellys, inside) arrays. Project
+        CRS points are transformed one at a time, so prefer layer CRS.
+        '''
+        if self.grid is None:
+            shape = numpy.shape(xs)
+            return (numpy.zeros(shape, dtype=numpy.int64), numpy.zeros(shape, dtype=numpy.int64),
+                    numpy.zeros(shape, dtype=bool))
+
+        if projectCrs:
+            xform = self._transform()
+            if not self._isIdentityTransform():
+                xs, ys = _reproject(xform, numpy.asarray(xs, dtype=numpy.float64),
+                                    numpy.asarray(ys, dtype=numpy.float64),
+                                    core.QgsCoordinateTransform.ReverseTransform)
+
+        return self.grid.cellsAt(xs, ys)
 
     def _setHorizontalLabelAttributes(self, feature, angle):
         if self.label_orientation == 0 or self.label_orientation == 3:
@@ -281,8 +1397,20 @@ class GridPluginLayer(core.QgsPluginLayer):
             feature.addAttribute(5, self.label_yoff_horizontal)
 
     def formatLabel(self, angleValue, hemisphere, showDegrees):
-        angle = Angle(angleValue)
-        labeltext = ''
+        key = (self.label_format, self.label_precision, self.label_hemisphere,
+               self.label_leading_zeros, hemisphere, showDegrees)
+        formatter = self._labelFormatters.get(key)
+
+        if formatter is None:
+            spec = self._labelFormatSpec(hemisphere, showDegrees)
+            formatter = self._labelFormatters[key] = AngleFormat.compile(spec)
+
+        self.statistics.count('labels formatted')
+        return formatter.formatValue(angleValue)
+
+    def _labelFormatSpec(self, hemisphere, showDegrees):
+        '''Returns the Angle format spec for the current label settings.'''
+        spec = ''
         
         if showDegrees:
             sign, hemisphere = ('', hemisphere) if self.label_hemisphere else ('%g', '')
@@ -296,67 +1424,63 @@ class GridPluginLayer(core.QgsPluginLayer):
             # Decimal degrees.
             decimal = '.%{0}d'.format(self.label_precision) if self.label_precision > 0 else ''
             if showDegrees:
-                labeltext = u'{0:{sign}%{pad}D\u00b0{decimal} {hemisphere}}'.format(angle, decimal=decimal, sign=sign, hemisphere=hemisphere, pad=pad)
+                spec = u'{sign}%{pad}D\u00b0{decimal} {hemisphere}'.format(decimal=decimal, sign=sign, hemisphere=hemisphere, pad=pad)
             else:
-                labeltext = u'{0:{sign}{decimal} {hemisphere}}'.format(angle, decimal=decimal, sign=sign, hemisphere=hemisphere)
+                spec = u'{sign}{decimal} {hemisphere}'.format(decimal=decimal, sign=sign, hemisphere=hemisphere)
             
         elif self.label_format == 1:
             # Degrees, decimal minutes.
             decimal = '.%{0}m'.format(self.label_precision) if self.label_precision > 0 else ''
             if showDegrees:
-                labeltext = u'{0:{sign}%{pad}D\u00b0 %{pad}M\'{decimal} {hemisphere}}'.format(angle, decimal=decimal, sign=sign, hemisphere=hemisphere, pad=pad)
+                spec = u'{sign}%{pad}D\u00b0 %{pad}M\'{decimal} {hemisphere}'.format(decimal=decimal, sign=sign, hemisphere=hemisphere, pad=pad)
             else:
-                labeltext = u'{0:{sign}%{pad}M\'{decimal} {hemisphere}}'.format(angle, decimal=decimal, sign=sign, hemisphere=hemisphere, pad=pad)
+                spec = u'{sign}%{pad}M\'{decimal} {hemisphere}'.format(decimal=decimal, sign=sign, hemisphere=hemisphere, pad=pad)
             
         elif self.label_format == 2:
             # Degrees, minutes, decimal seconds.
             decimal = '.%{0}s'.format(self.label_precision) if self.label_precision > 0 else ''
             if showDegrees:
-                labeltext = u'{0:{sign}%{pad}D\u00b0 %{pad}M\' %{pad}S"{decimal} {hemisphere}}'.format(angle, decimal=decimal, sign=sign, hemisphere=hemisphere, pad=pad)
+                spec = u'{sign}%{pad}D\u00b0 %{pad}M\' %{pad}S"{decimal} {hemisphere}'.format(decimal=decimal, sign=sign, hemisphere=hemisphere, pad=pad)
             else:
-                labeltext = u'{0:{sign}%{pad}M\' %{pad}S"{decimal} {hemisphere}}'.format(angle, decimal=decimal, sign=sign, hemisphere=hemisphere, pad=pad)
+                spec = u'{sign}%{pad}M\' %{pad}S"{decimal} {hemisphere}'.format(decimal=decimal, sign=sign, hemisphere=hemisphere, pad=pad)
         
-        return labeltext
+        return spec
 
     def setCrs(self, crs):
         core.QgsPluginLayer.setCrs(self, crs)
-        self.generateGrid()
+        if self.vectorLayers is not None:
+            for layer in self.vectorLayers.layers():
+                layer.setCrs(crs)
+        self.updateGrid()
         self.setCacheImage(None)
         self.emit(QtCore.SIGNAL('repaintRequested()'))
 
     def readXml(self, node):
+        '''
+        Reads the properties saved by writeXml or an older version of it,
+        regenerating only the stages that changed.
+        '''
         element = node.toElement()
-        
-        org_x = float(element.attribute('origin_x', '0.0'))
-        org_y = float(element.attribute('origin_y', '0.0'))
-        self.origin = core.QgsPoint(org_x, org_y)
-        self.numCellsX = int(element.attribute('num_cells_x', '1'))
-        self.numCellsY = int(element.attribute('num_cells_y', '1'))
-        self.gridOffsetX = int(element.attribute('grid_offset_x', '0'))
-        self.gridOffsetY = int(element.attribute('grid_offset_y', '0'))
-        self.cellSizeX = float(element.attribute('cell_size_x', '10.0'))
-        self.cellSizeY = float(element.attribute('cell_size_y', '10.0'))
-        self.baselineAngle = float(element.attribute('baseline_angle', '0.0'))
-        
         labelElement = node.firstChildElement('label')
-        if labelElement is not None:
-            self.draw_labels = bool(labelElement.attribute('draw_labels', '0'))
-            self.label_type = int(labelElement.attribute('type', '0'))
-            self.label_precision = int(labelElement.attribute('precision', '0'))
-            self.label_orientation = int(labelElement.attribute('orientation', '0'))
-            self.label_format = int(labelElement.attribute('format', '0'))
-            self.label_hemisphere = bool(labelElement.attribute('hemisphere', 'true'))
-            self.label_xoff_horizontal = float(labelElement.attribute('xoff_horizontal', '0.0'))
-            self.label_xoff_vertical = float(labelElement.attribute('xoff_vertical', '0.0'))
-            self.label_yoff_horizontal = float(labelElement.attribute('yoff_horizontal', '0.0'))
-            self.label_yoff_vertical = float(labelElement.attribute('yoff_vertical', '0.0'))
-            self.label_leading_zeros = bool(labelElement.attribute('leading_zeros', 'true'))
-            self.label_degrees_diff = bool(labelElement.attribute('degrees_diff', 'false'))
+
+        version = _readAttribute(element, 'grid_version', int, 0)
+        if version > GridPluginLayer.XML_VERSION and hasattr(core, 'QgsMessageLog'):
+            core.QgsMessageLog.logMessage('A grid layer was saved by a newer version of the plugin '
+                                          '(grid_version {0}); properties it added are ignored.'.format(version),
+                                          'Grid overlay', core.QgsMessageLog.WARNING)
+
+        self.origin = core.QgsPoint(_readAttribute(element, 'origin_x', float, self.origin.x()),
+                                    _readAttribute(element, 'origin_y', float, self.origin.y()))
+        self._readAttributes(element, GridPluginLayer.LAYER_ATTRIBUTES)
+
+        if not labelElement.isNull():
+            self._readAttributes(labelElement, GridPluginLayer.LABEL_ATTRIBUTES)
             attributesElement = labelElement.firstChildElement('labelattributes')
-            if attributesElement is not None:
+            if not attributesElement.isNull():
                 self.label.readXML(attributesElement)
-        
-        self.generateGrid()
+
+        self._readSubgrids(node)
+        self.updateGrid()
         self.readSymbology(node, None)
 
         return True
@@ -365,42 +1489,63 @@ class GridPluginLayer(core.QgsPluginLayer):
         element = node.toElement()
         element.setAttribute('type', 'plugin')
         element.setAttribute('name', GridPluginLayer.LAYER_TYPE);
+        element.setAttribute('grid_version', str(GridPluginLayer.XML_VERSION))
         # Custom properties.
-        element.setAttribute('origin_x', str(self.origin.x()))
-        element.setAttribute('origin_y', str(self.origin.y()))
-        element.setAttribute('num_cells_x', str(self.numCellsX))
-        element.setAttribute('num_cells_y', str(self.numCellsY))
-        element.setAttribute('grid_offset_x', str(self.gridOffsetX))
-        element.setAttribute('grid_offset_y', str(self.gridOffsetY))
-        element.setAttribute('cell_size_x', str(self.cellSizeX))
-        element.setAttribute('cell_size_y', str(self.cellSizeY))
-        element.setAttribute('baseline_angle', str(self.baselineAngle))
+        element.setAttribute('origin_x', _formatAttribute(self.origin.x(), float))
+        element.setAttribute('origin_y', _formatAttribute(self.origin.y(), float))
+        self._writeAttributes(element, GridPluginLayer.LAYER_ATTRIBUTES)
 
         labelElement = doc.createElement('label')
-        labelElement.setAttribute('draw_labels', str(self.draw_labels))
-        labelElement.setAttribute('type', str(self.label_type))
-        labelElement.setAttribute('precision', str(self.label_precision))
-        labelElement.setAttribute('orientation', str(self.label_orientation))
-        labelElement.setAttribute('format', str(self.label_format))
-        labelElement.setAttribute('hemisphere', str(self.label_hemisphere))
-        labelElement.setAttribute('xoff_horizontal', str(self.label_xoff_horizontal))
-        labelElement.setAttribute('xoff_vertical', str(self.label_xoff_vertical))
-        labelElement.setAttribute('yoff_horizontal', str(self.label_yoff_horizontal))
-        labelElement.setAttribute('yoff_vertical', str(self.label_yoff_vertical))
-        labelElement.setAttribute('leading_zeros', str(self.label_leading_zeros))
-        labelElement.setAttribute('degrees_diff', str(self.label_degrees_diff))
+        self._writeAttributes(labelElement, GridPluginLayer.LABEL_ATTRIBUTES)
         self.label.writeXML(labelElement, doc)
         
         node.appendChild(labelElement)
+
+        self._writeSubgrids(node, doc)
         
         self.writeSymbology(node, doc, None)
 
         return True
 
+    def _readAttributes(self, element, attributes, target=None):
+        target = self if target is None else target
+        for name, prop, kind in attributes:
+            setattr(target, prop, _readAttribute(element, name, kind, getattr(target, prop)))
+
+    def _writeAttributes(self, element, attributes, target=None):
+        target = self if target is None else target
+        for name, prop, kind in attributes:
+            element.setAttribute(name, _formatAttribute(getattr(target, prop), kind))
+
+    def _readSubgrids(self, node):
+        subgrids = []
+        subgridElement = node.firstChildElement('subgrid')
+
+        while not subgridElement.isNull():
+            subgrid = Subgrid()
+            self._readAttributes(subgridElement, GridPluginLayer.SUBGRID_ATTRIBUTES, subgrid)
+
+            symbolElement = subgridElement.firstChildElement('symbol')
+            if not symbolElement.isNull():
+                subgrid.symbol = core.QgsSymbolLayerV2Utils.loadSymbol(symbolElement)
+
+            subgrids.append(subgrid)
+            subgridElement = subgridElement.nextSiblingElement('subgrid')
+
+        self.setSubgrids(subgrids)
+
+    def _writeSubgrids(self, node, doc):
+        for subgrid in self.subgrids:
+            subgridElement = doc.createElement('subgrid')
+            self._writeAttributes(subgridElement, GridPluginLayer.SUBGRID_ATTRIBUTES, subgrid)
+            subgridElement.appendChild(core.QgsSymbolLayerV2Utils.saveSymbol('subgrid_lines', subgrid.symbol,
+                                                                              doc, None))
+            node.appendChild(subgridElement)
+
     def readSymbology(self, node, errorMessage):
         symbolElement = node.firstChildElement('symbol')
 
-        if symbolElement is not None and symbolElement.attribute('name') == 'grid_lines':
+        if not symbolElement.isNull() and symbolElement.attribute('name') == 'grid_lines':
             self.symbol = core.QgsSymbolLayerV2Utils.loadSymbol(symbolElement)
             self.setCacheImage(None)
             self.emit(QtCore.SIGNAL('repaintRequested()'))
@@ -420,7 +1565,9 @@ class GridPluginLayer(core.QgsPluginLayer):
         result = dlg.exec_()
 
         if result == 1:
-            self.generateGrid()
+            self.updateGrid()
+            if self.vectorLayers is not None:
+                self.vectorLayers.updateStyle()
             self.setValid(True)
             self.setCacheImage(None)
             self.emit(QtCore.SIGNAL('repaintRequested()'))
@@ -42,8 +42,13 @@ class GridPropertiesDialog(QtGui.QDialog):
         self.ui.btnFont.clicked.connect(self.chooseFont)
         self.ui.btnColour.clicked.connect(self.chooseColour)
         self.ui.comboLabelType.currentIndexChanged.connect(self.disableDegreeFields)
+        self.ui.btnAddSubgrid.clicked.connect(self.addSubgrid)
+        self.ui.btnRemoveSubgrid.clicked.connect(self.removeSubgrid)
+        self.ui.btnSubgridStyle.clicked.connect(self.chooseSubgridStyle)
 
         self.symbol = gridlayer.symbol.clone()
+        # One per row of the subgrid table.
+        self.subgridSymbols = []
         self.label_attributes = core.QgsLabelAttributes()
         
         # Store attributes in case the user changes font attributes but cancels the dialog box.
@@ -65,6 +70,7 @@ class GridPropertiesDialog(QtGui.QDialog):
         self.ui.spinCellSizeX.setValue(gridlayer.cellSizeX)
         self.ui.spinCellSizeY.setValue(gridlayer.cellSizeY)
         self.ui.spinAngle.setValue(gridlayer.baselineAngle)
+        self.ui.spinMinSpacing.setValue(gridlayer.minLineSpacing)
         self.ui.comboLabelType.setCurrentIndex(gridlayer.label_type)
         self.ui.spinPrecision.setValue(gridlayer.label_precision)
         self.ui.comboOrientation.setCurrentIndex(gridlayer.label_orientation)
@@ -77,6 +83,9 @@ class GridPropertiesDialog(QtGui.QDialog):
         self.ui.spinXOffsetVertical.setValue(gridlayer.label_xoff_vertical)
         self.ui.spinYOffsetHorizontal.setValue(gridlayer.label_yoff_horizontal)
         self.ui.spinYOffsetVertical.setValue(gridlayer.label_yoff_vertical)
+
+        for subgrid in gridlayer.subgrids:
+            self._addSubgridRow(subgrid)
         
         self.disableDegreeFields(0)
         
@@ -89,6 +98,7 @@ class GridPropertiesDialog(QtGui.QDialog):
         self.gridlayer.cellSizeX = self.ui.spinCellSizeX.value()
         self.gridlayer.cellSizeY = self.ui.spinCellSizeY.value()
         self.gridlayer.baselineAngle = self.ui.spinAngle.value()
+        self.gridlayer.minLineSpacing = self.ui.spinMinSpacing.value()
         self.gridlayer.draw_labels = self.ui.boxLabels.isChecked()
         self.gridlayer.label_type = self.ui.comboLabelType.currentIndex()
         self.gridlayer.label_precision = self.ui.spinPrecision.value()
@@ -121,6 +131,14 @@ class GridPropertiesDialog(QtGui.QDialog):
         self.gridlayer.label_xoff_vertical = self.ui.spinXOffsetVertical.value()
         self.gridlayer.label_yoff_horizontal = self.ui.spinYOffsetHorizontal.value()
         self.gridlayer.label_yoff_vertical = self.ui.spinYOffsetVertical.value()
+
+        # gridpluginlayer imports this module.
+        from gridpluginlayer import Subgrid
+        table = self.ui.tableSubgrids
+        self.gridlayer.setSubgrids([Subgrid(table.cellWidget(row, 0).value(), table.cellWidget(row, 1).value(),
+                                            symbol.clone(), table.cellWidget(row, 2).value(),
+                                            table.cellWidget(row, 3).isChecked())
+                                    for row, symbol in enumerate(self.subgridSymbols)])
         
         QtGui.QDialog.accept(self)
         
@@ -128,16 +146,61 @@ class GridPropertiesDialog(QtGui.QDialog):
         QtGui.QDialog.reject(self)
 
     def chooseStyle(self):
+        self._chooseSymbol(self.symbol)
+
+    def _chooseSymbol(self, symbol):
         if QGis.QGIS_VERSION_INT < 10800:
-            dlg = gui.QgsSymbolV2SelectorDialog(self.symbol,
+            dlg = gui.QgsSymbolV2SelectorDialog(symbol,
                                                 core.QgsStyleV2.defaultStyle())
         else:
-            dlg = gui.QgsSymbolV2SelectorDialog(self.symbol,
+            dlg = gui.QgsSymbolV2SelectorDialog(symbol,
                                                 core.QgsStyleV2.defaultStyle(),
                                                 None)
         dlg.show()
         dlg.exec_()
 
+    def addSubgrid(self):
+        from gridpluginlayer import Subgrid
+        self._addSubgridRow(Subgrid())
+        self.ui.tableSubgrids.selectRow(self.ui.tableSubgrids.rowCount() - 1)
+
+    def removeSubgrid(self):
+        row = self.ui.tableSubgrids.currentRow()
+
+        if row >= 0:
+            self.ui.tableSubgrids.removeRow(row)
+            del self.subgridSymbols[row]
+
+    def chooseSubgridStyle(self):
+        row = self.ui.tableSubgrids.currentRow()
+
+        if row >= 0:
+            self._chooseSymbol(self.subgridSymbols[row])
+
+    def _addSubgridRow(self, subgrid):
+        table = self.ui.tableSubgrids
+        row = table.rowCount()
+        table.insertRow(row)
+
+        for column, divisions in ((0, subgrid.divisionsX), (1, subgrid.divisionsY)):
+            spin = QtGui.QSpinBox()
+            spin.setRange(1, 1000)
+            spin.setValue(divisions)
+            table.setCellWidget(row, column, spin)
+
+        spin = QtGui.QDoubleSpinBox()
+        spin.setDecimals(1)
+        spin.setMaximum(100.0)
+        spin.setSuffix(' px')
+        spin.setValue(subgrid.minSpacing)
+        table.setCellWidget(row, 2, spin)
+
+        check = QtGui.QCheckBox()
+        check.setChecked(subgrid.draw_labels)
+        table.setCellWidget(row, 3, check)
+
+        self.subgridSymbols.append(subgrid.symbol.clone())
+
     def chooseFont(self):
         dlg = QtGui.QFontDialog()
         dlg.show()
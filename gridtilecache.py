@@ -0,0 +1,131 @@
+"""
+/***************************************************************************
+ gridtilecache - Rendered grid tiles kept between redraws.
+                                 A QGIS plugin
+ Overlays a user-definable grid on the map.
+                             -------------------
+        begin                : 2026-10-18
+        copyright            : (C) 2026 by agent
+        email                : agent@local
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+from PyQt4 import QtGui
+
+from util import LRUCache
+
+class TileCache(object):
+    '''
+    Rendered tile images by key, the least recently used beyond maxSize being
+    discarded. If spillDir is set, discarded tiles are written to a new
+    directory in it instead, up to spillSize of them, and read back when they
+    are next asked for. Spilled tiles last until the cache is cleared, and
+    the directory until the cache is closed.
+
+    Keys are strings; digest() makes one from any tuple of plain values.
+    '''
+
+    def __init__(self, maxSize, spillDir=None, spillSize=0):
+        self._tiles = LRUCache(maxSize, self._spill)
+        self._spilled = LRUCache(max(spillSize, 1), self._unspill)
+        self._spillRoot = spillDir if spillSize > 0 else None
+        # Made on the first spill.
+        self.spillDir = None
+
+    @staticmethod
+    def digest(key):
+        return hashlib.sha1(repr(key)).hexdigest()
+
+    def __len__(self):
+        return len(self._tiles)
+
+    def get(self, key):
+        tile = self._tiles.get(key)
+
+        if tile is None and key in self._spilled:
+            tile = self._read(self._spilled.get(key))
+            if tile is not None:
+                self._tiles[key] = tile
+
+        return tile
+
+    def __setitem__(self, key, tile):
+        self._tiles[key] = tile
+
+    def clear(self):
+        self._tiles.clear()
+
+        for key, path in self._spilled.items():
+            self._unspill(key, path)
+        self._spilled.clear()
+
+    def close(self):
+        '''Clears the cache and deletes its spill directory.'''
+        self.clear()
+
+        if self.spillDir is not None:
+            shutil.rmtree(self.spillDir, ignore_errors=True)
+            self.spillDir = None
+
+        self._spillRoot = None
+
+    def _spill(self, key, tile):
+        if key in self._spilled or not self._makeSpillDir():
+            return
+
+        path = os.path.join(self.spillDir, key + '.tile')
+        # Raw premultiplied pixels: a PNG would round semi-transparent ones.
+        data = tile.constBits().asstring(tile.byteCount())
+
+        try:
+            with open(path, 'wb') as f:
+                f.write('{0} {1}\n'.format(tile.width(), tile.height()))
+                f.write(data)
+        except IOError:
+            return
+
+        self._spilled[key] = path
+
+    def _makeSpillDir(self):
+        if self.spillDir is None and self._spillRoot:
+            try:
+                if not os.path.isdir(self._spillRoot):
+                    os.makedirs(self._spillRoot)
+                self.spillDir = tempfile.mkdtemp(prefix='gridoverlay-', dir=self._spillRoot)
+            except OSError:
+                self._spillRoot = None
+
+        return self.spillDir is not None
+
+    def _unspill(self, key, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _read(self, path):
+        try:
+            with open(path, 'rb') as f:
+                width, height = [int(n) for n in f.readline().split()]
+                data = f.read()
+        except (IOError, ValueError):
+            return None
+
+        if len(data) != width * height * 4:
+            return None
+
+        return QtGui.QImage(data, width, height, QtGui.QImage.Format_ARGB32_Premultiplied).copy()
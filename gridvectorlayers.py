@@ -0,0 +1,187 @@
+"""
+/***************************************************************************
+ gridvectorlayers - The grid as memory provider vector layers.
+                                 A QGIS plugin
+ Overlays a user-definable grid on the map.
+                             -------------------
+        begin                : 2026-10-18
+        copyright            : (C) 2026 by agent
+        email                : agent@local
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import math
+
+import numpy
+from PyQt4 import QtCore, QtGui
+from qgis import core
+
+from gridgeometry import HORIZONTAL
+
+class GridVectorLayers(object):
+    '''
+    Mirrors a GridPluginLayer's lines and label anchors into a pair of
+    memory provider layers with spatial indexes. QGIS then draws them like
+    any other vector layer, fetching only the features in view, and the
+    labels are placed by the PAL labeling engine, which drops those that
+    would overlap.
+
+    Only the main grid is mirrored, not its subgrids. Larger grids are
+    thinned to every n'th line and label to keep each layer within
+    MAX_FEATURES, and label features are only made while labels are on.
+    '''
+
+    # Features added to a provider at a time.
+    CHUNK_SIZE = 4096
+    MAX_FEATURES = 100000
+
+    _lineFields = [core.QgsField('axis', QtCore.QVariant.Int, 'integer', 1),
+                   core.QgsField('line', QtCore.QVariant.Int, 'integer', 8)]
+
+    def __init__(self, gridLayer):
+        self.gridLayer = gridLayer
+        name = unicode(gridLayer.name())
+
+        self.lines = self._createLayer('LineString', u'{0} lines'.format(name), self._lineFields)
+        labelFields = [gridLayer._featuremap[i] for i in sorted(gridLayer._featuremap)]
+        self.labels = self._createLayer('Point', u'{0} labels'.format(name), labelFields)
+        # Whether the label layer holds features, made for draw_labels.
+        self._labelsShown = False
+
+        self.updateLines()
+        self.updateLabels()
+
+    def layers(self):
+        return [self.lines, self.labels]
+
+    def _createLayer(self, geometryType, name, fields):
+        layer = core.QgsVectorLayer(geometryType, name, 'memory')
+        layer.setCrs(self.gridLayer.crs())
+
+        provider = layer.dataProvider()
+        provider.addAttributes(fields)
+        provider.createSpatialIndex()
+        layer.updateFieldMap()
+
+        return layer
+
+    def updateStyle(self):
+        '''
+        Copies the grid layer's symbol and label settings, making or dropping
+        the label features if draw_labels has changed.
+        '''
+        gridLayer = self.gridLayer
+        if gridLayer.draw_labels != self._labelsShown:
+            self._replaceLabels()
+
+        self.lines.setRendererV2(core.QgsSingleSymbolRendererV2(gridLayer.symbol.clone()))
+
+        attributes = gridLayer.label.labelAttributes()
+        font = QtGui.QFont(attributes.family())
+        font.setPointSizeF(attributes.size())
+        font.setBold(attributes.bold())
+        font.setItalic(attributes.italic())
+        font.setUnderline(attributes.underline())
+        font.setStrikeOut(attributes.strikeOut())
+
+        settings = core.QgsPalLayerSettings()
+        settings.readFromLayer(self.labels)
+        settings.enabled = gridLayer.draw_labels
+        # The same fields as the QgsLabel uses. See GridPropertiesDialog.
+        settings.fieldName = 'cell_num' if gridLayer.label_type == 1 else 'ordinate'
+        settings.placement = core.QgsPalLayerSettings.OverPoint
+        settings.displayAll = False
+        settings.textFont = font
+        settings.textColor = attributes.color()
+        settings.setDataDefinedProperty(core.QgsPalLayerSettings.Rotation, 1)
+        settings.writeToLayer(self.labels)
+
+        # The anchors themselves aren't drawn.
+        symbol = core.QgsMarkerSymbolV2.createSimple({'size': '0'})
+        symbol.setAlpha(0.0)
+        self.labels.setRendererV2(core.QgsSingleSymbolRendererV2(symbol))
+
+        for layer in self.layers():
+            layer.setCacheImage(None)
+
+    def updateLines(self):
+        grid = self.gridLayer.grid
+        self._replaceFeatures(self.lines, self._lineFeatures(grid) if grid is not None else [])
+
+    def updateLabels(self):
+        self._replaceLabels()
+        self.updateStyle()
+
+    def _replaceLabels(self):
+        gridLayer = self.gridLayer
+        self._labelsShown = gridLayer.draw_labels
+
+        if gridLayer.grid is None or not gridLayer.draw_labels:
+            features = []
+        else:
+            grid = gridLayer.grid
+            if gridLayer.label_type == 2:
+                # One per cell.
+                stride = self._stride(math.sqrt(float(grid.numCellsX) * grid.numCellsY / self.MAX_FEATURES))
+            else:
+                stride = self._stride(float(grid.numRows + grid.numCols) / self.MAX_FEATURES)
+
+            features = (gridLayer._buildLabel(key) for key in gridLayer._visibleLabelKeys(None, stride, stride))
+
+        self._replaceFeatures(self.labels, features)
+
+    @staticmethod
+    def _lineFeatures(grid):
+        # Lines are straight in the layer CRS, so their ends are enough.
+        stride = GridVectorLayers._stride(float(grid.numRows + grid.numCols) / GridVectorLayers.MAX_FEATURES)
+
+        for axis, line, first, last in grid.lineSpans(stride, stride):
+            xs, ys = grid.linePoints(axis, line, numpy.array([first, last]))
+
+            feat = core.QgsFeature()
+            feat.addAttribute(0, 0 if axis == HORIZONTAL else 1)
+            feat.addAttribute(1, line)
+            feat.setGeometry(core.QgsGeometry.fromPolyline([core.QgsPoint(float(xs[0]), float(ys[0])),
+                                                            core.QgsPoint(float(xs[1]), float(ys[1]))]))
+            yield feat
+
+    @staticmethod
+    def _stride(ratio):
+        '''Returns the stride that divides a feature count by at least ratio.'''
+        return max(int(math.ceil(ratio)), 1)
+
+    def _replaceFeatures(self, layer, features):
+        '''
+        Deletes the features of a memory layer and adds the new ones
+        CHUNK_SIZE at a time.
+        '''
+        provider = layer.dataProvider()
+
+        ids = []
+        feat = core.QgsFeature()
+        provider.select([])
+        while provider.nextFeature(feat):
+            ids.append(feat.id())
+        provider.deleteFeatures(ids)
+
+        chunk = []
+        for feat in features:
+            chunk.append(feat)
+            if len(chunk) == GridVectorLayers.CHUNK_SIZE:
+                provider.addFeatures(chunk)
+                chunk = []
+
+        if chunk:
+            provider.addFeatures(chunk)
+
+        layer.updateExtents()
+        layer.setCacheImage(None)
@@ -0,0 +1,102 @@
+"""
+/***************************************************************************
+ gridworker - Tiled rendering on worker threads.
+                                 A QGIS plugin
+ Overlays a user-definable grid on the map.
+                             -------------------
+        begin                : 2026-10-18
+        copyright            : (C) 2026 by agent
+        email                : agent@local
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import numpy
+
+from PyQt4 import QtCore, QtGui
+
+class TileRenderer(QtCore.QRunnable):
+    '''
+    Strokes polylines over a copy of one tile of an image. The tile is at
+    (x, y) in the image and is width by height pixels.
+    '''
+
+    def __init__(self, image, x, y, width, height, polylines, render, hints):
+        QtCore.QRunnable.__init__(self)
+        self.setAutoDelete(False)
+        self.image = image
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.polylines = polylines
+        self.render = render
+        self.hints = hints
+        self.tile = None
+
+    def run(self):
+        tile = self.image.copy(self.x, self.y, self.width, self.height)
+
+        painter = QtGui.QPainter(tile)
+        painter.setRenderHints(self.hints)
+        painter.translate(-self.x, -self.y)
+        self.render(painter, self.polylines)
+        painter.end()
+
+        self.tile = tile
+
+
+def canRenderTiles(painter):
+    '''
+    Returns whether renderTiles can reproduce painting directly with painter:
+    it must draw straight onto a QImage in device pixels.
+    '''
+    return (isinstance(painter.device(), QtGui.QImage) and painter.transform().isIdentity()
+            and not painter.hasClipping() and painter.opacity() == 1.0
+            and painter.compositionMode() == QtGui.QPainter.CompositionMode_SourceOver)
+
+
+def renderTiles(painter, polylines, bounds, render, tileSize=1024, margin=2.0, maxThreads=0):
+    '''
+    Paints polylines onto painter's image in tiles on a thread pool, with
+    render(painter, polylines), which must be thread-safe.
+    '''
+    image = painter.device()
+    bounds = numpy.asarray(bounds, dtype=numpy.float64).reshape(-1, 4)
+    tiles = []
+
+    for y in xrange(0, image.height(), tileSize):
+        height = min(tileSize, image.height() - y)
+        crossesRow = (bounds[:, 1] <= y + height + margin) & (bounds[:, 3] >= y - margin)
+
+        for x in xrange(0, image.width(), tileSize):
+            width = min(tileSize, image.width() - x)
+            crosses = crossesRow & (bounds[:, 0] <= x + width + margin) & (bounds[:, 2] >= x - margin)
+
+            indices = numpy.nonzero(crosses)[0]
+            if len(indices) > 0:
+                tiles.append(TileRenderer(image, x, y, width, height,
+                                          [polylines[i] for i in indices],
+                                          render, painter.renderHints()))
+
+    pool = QtCore.QThreadPool()
+    if maxThreads > 0:
+        pool.setMaxThreadCount(maxThreads)
+
+    for tile in tiles:
+        pool.start(tile)
+    pool.waitForDone()
+
+    painter.save()
+    painter.setCompositionMode(QtGui.QPainter.CompositionMode_Source)
+    for tile in tiles:
+        painter.drawImage(tile.x, tile.y, tile.tile)
+    painter.restore()
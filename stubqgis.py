@@ -0,0 +1,572 @@
+"""
+/***************************************************************************
+ stubqgis - Just enough of the PyQt4 and QGIS APIs to run the grid layer
+ headless, for the benchmarks.
+                                 A QGIS plugin
+ Overlays a user-definable grid on the map.
+                             -------------------
+        begin                : 2026-10-18
+        copyright            : (C) 2026 by agent
+        email                : agent@local
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+The stubs do no drawing. Painters, symbols and labels only count what they
+are given, and the one coordinate transform there is goes between
+geographic coordinates (GEOGRAPHIC_SRSID) and spherical Mercator
+(MERCATOR_SRSID).
+"""
+
+import math
+import sys
+import types
+
+GEOGRAPHIC_SRSID = 3452
+MERCATOR_SRSID = 3857
+EARTH_RADIUS = 6378137.0
+
+# The project CRS that QgsProject reports.
+projectSrsid = GEOGRAPHIC_SRSID
+
+
+class Counter(object):
+    '''Counts of what the stubs were asked to draw.'''
+    polylines = 0
+    vertices = 0
+    labels = 0
+
+    @classmethod
+    def reset(cls):
+        cls.polylines = 0
+        cls.vertices = 0
+        cls.labels = 0
+
+
+# PyQt4.QtCore
+
+def SIGNAL(signature):
+    return signature
+
+
+class _BoundSignal(object):
+    def __init__(self):
+        self._slots = []
+
+    def connect(self, slot):
+        self._slots.append(slot)
+
+    def disconnect(self, slot):
+        self._slots.remove(slot)
+
+    def emit(self, *args):
+        for slot in list(self._slots):
+            slot(*args)
+
+
+class pyqtSignal(object):
+    def __init__(self, *types):
+        self._name = '_signal_{0}'.format(id(self))
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+
+        signal = instance.__dict__.get(self._name)
+        if signal is None:
+            signal = instance.__dict__[self._name] = _BoundSignal()
+        return signal
+
+
+class QObject(object):
+    def __init__(self, *args):
+        pass
+
+    def emit(self, *args):
+        pass
+
+
+class QVariant(object):
+    Int = 2
+    Double = 6
+    String = 10
+
+    def __init__(self, value=None):
+        self._value = value
+
+    def toString(self):
+        return u'' if self._value is None else unicode(self._value)
+
+    def toDouble(self):
+        return float(self._value or 0.0), True
+
+
+class QSettings(object):
+    def value(self, key, default=None):
+        return QVariant(default)
+
+
+class QThread(QObject):
+    '''Runs on start(), in the calling thread.'''
+    finished = pyqtSignal()
+
+    def start(self):
+        self.run()
+        self.finished.emit()
+
+    def run(self):
+        pass
+
+    @staticmethod
+    def idealThreadCount():
+        return 1
+
+
+class QRunnable(object):
+    def __init__(self):
+        pass
+
+    def setAutoDelete(self, autoDelete):
+        pass
+
+
+class QThreadPool(object):
+    def setMaxThreadCount(self, count):
+        pass
+
+    def start(self, runnable):
+        runnable.run()
+
+    def waitForDone(self):
+        pass
+
+
+class QPointF(object):
+    def __init__(self, x=0.0, y=0.0):
+        self._x = x
+        self._y = y
+
+    def x(self):
+        return self._x
+
+    def y(self):
+        return self._y
+
+    def __eq__(self, other):
+        return self._x == other.x() and self._y == other.y()
+
+
+# PyQt4.QtGui
+
+class QPolygonF(object):
+    def __init__(self, points=0):
+        self._points = [QPointF() for i in xrange(points)] if isinstance(points, int) else list(points)
+
+    def append(self, point):
+        self._points.append(point)
+
+    def at(self, i):
+        return self._points[i]
+
+    def size(self):
+        return len(self._points)
+
+
+class QImage(object):
+    pass
+
+
+class QPainter(object):
+    CompositionMode_SourceOver = 0
+    CompositionMode_Source = 2
+
+
+class QDialog(QObject):
+    pass
+
+
+class QDomDocument(object):
+    pass
+
+
+# qgis.core
+
+class QGis(object):
+    QGIS_VERSION_INT = 10800
+
+
+class QgsPoint(object):
+    def __init__(self, x=0.0, y=0.0):
+        if isinstance(x, QgsPoint):
+            x, y = x.x(), x.y()
+        self._x = float(x)
+        self._y = float(y)
+
+    def x(self):
+        return self._x
+
+    def y(self):
+        return self._y
+
+
+class QgsRectangle(object):
+    def __init__(self, xmin=0.0, ymin=0.0, xmax=0.0, ymax=0.0):
+        self._bounds = (xmin, ymin, xmax, ymax)
+
+    def xMinimum(self):
+        return self._bounds[0]
+
+    def yMinimum(self):
+        return self._bounds[1]
+
+    def xMaximum(self):
+        return self._bounds[2]
+
+    def yMaximum(self):
+        return self._bounds[3]
+
+    def width(self):
+        return self._bounds[2] - self._bounds[0]
+
+    def height(self):
+        return self._bounds[3] - self._bounds[1]
+
+
+class QgsCsException(Exception):
+    pass
+
+
+class QgsCoordinateReferenceSystem(object):
+    InternalCrsId = 1
+
+    def __init__(self, srsid=GEOGRAPHIC_SRSID, kind=InternalCrsId):
+        self._srsid = srsid
+
+    def srsid(self):
+        return self._srsid
+
+    def geographicFlag(self):
+        return self._srsid == GEOGRAPHIC_SRSID
+
+
+class QgsCoordinateTransform(object):
+    ForwardTransform = 0
+    ReverseTransform = 1
+
+    def __init__(self, source, dest):
+        self._source = source.srsid()
+        self._dest = dest.srsid()
+
+    def transform(self, point, direction=ForwardTransform):
+        source, dest = self._source, self._dest
+        if direction == QgsCoordinateTransform.ReverseTransform:
+            source, dest = dest, source
+
+        x, y = point.x(), point.y()
+
+        if source == dest:
+            return QgsPoint(x, y)
+        elif source == GEOGRAPHIC_SRSID:
+            if abs(y) >= 90.0:
+                raise QgsCsException('Latitude out of range')
+            return QgsPoint(EARTH_RADIUS * math.radians(x),
+                            EARTH_RADIUS * math.log(math.tan(math.pi / 4.0 + math.radians(y) / 2.0)))
+        else:
+            return QgsPoint(math.degrees(x / EARTH_RADIUS),
+                            math.degrees(2.0 * math.atan(math.exp(y / EARTH_RADIUS)) - math.pi / 2.0))
+
+    def transformBoundingBox(self, rect, direction=ForwardTransform):
+        # Like QGIS, samples the rectangle at 8 x 8 points.
+        points = [self.transform(QgsPoint(rect.xMinimum() + rect.width() * i / 7.0,
+                                          rect.yMinimum() + rect.height() * j / 7.0), direction)
+                  for i in xrange(8) for j in xrange(8)]
+        xs = [p.x() for p in points]
+        ys = [p.y() for p in points]
+        return QgsRectangle(min(xs), min(ys), max(xs), max(ys))
+
+
+class QgsProject(object):
+    _instance = None
+
+    @classmethod
+    def instance(cls):
+        if cls._instance is None:
+            cls._instance = QgsProject()
+        return cls._instance
+
+    def readNumEntry(self, scope, key, default=0):
+        return projectSrsid, True
+
+
+class QgsMapToPixel(object):
+    def __init__(self, mapUnitsPerPixel, yMax, xMin):
+        self._mapUnitsPerPixel = mapUnitsPerPixel
+        self._yMax = yMax
+        self._xMin = xMin
+
+    def mapUnitsPerPixel(self):
+        return self._mapUnitsPerPixel
+
+    def transform(self, x, y):
+        return QgsPoint((x - self._xMin) / self._mapUnitsPerPixel,
+                        (self._yMax - y) / self._mapUnitsPerPixel)
+
+
+class _Device(object):
+    def __init__(self, width, height):
+        self._width = width
+        self._height = height
+
+    def width(self):
+        return self._width
+
+    def height(self):
+        return self._height
+
+
+class _Painter(object):
+    def __init__(self, width, height):
+        self._device = _Device(width, height)
+
+    def device(self):
+        return self._device
+
+
+class QgsRenderContext(object):
+    def __init__(self, extent=None, width=0, height=0):
+        self._extent = extent or QgsRectangle()
+        mapUnitsPerPixel = self._extent.width() / float(width) if width > 0 else 1.0
+        self._mapToPixel = QgsMapToPixel(mapUnitsPerPixel, self._extent.yMaximum(), self._extent.xMinimum())
+        self._painter = _Painter(width, height)
+
+    def extent(self):
+        return self._extent
+
+    def mapToPixel(self):
+        return self._mapToPixel
+
+    def painter(self):
+        return self._painter
+
+    def scaleFactor(self):
+        return 3.78
+
+    def rasterScaleFactor(self):
+        return 1.0
+
+    def rendererScale(self):
+        return 1.0
+
+
+class QgsField(object):
+    def __init__(self, *args):
+        pass
+
+
+class QgsGeometry(object):
+    @staticmethod
+    def fromPoint(point):
+        geometry = QgsGeometry()
+        geometry.point = point
+        return geometry
+
+    @staticmethod
+    def fromPolyline(points):
+        geometry = QgsGeometry()
+        geometry.polyline = list(points)
+        return geometry
+
+
+class QgsFeature(object):
+    def __init__(self):
+        self.attributes = {}
+        self.geometry = None
+
+    def addAttribute(self, index, value):
+        self.attributes[index] = value
+
+    def attributeMap(self):
+        return dict((index, QVariant(value)) for index, value in self.attributes.items())
+
+    def setGeometry(self, geometry):
+        self.geometry = geometry
+
+
+class QgsLabelAttributes(object):
+    def size(self):
+        return 10.0
+
+
+class QgsLabel(object):
+    def __init__(self, fields=None):
+        self._attributes = QgsLabelAttributes()
+
+    def labelAttributes(self):
+        return self._attributes
+
+    def renderLabel(self, renderContext, feature, selected):
+        Counter.labels += 1
+
+    def readXML(self, element):
+        pass
+
+    def writeXML(self, element, doc):
+        pass
+
+
+class QgsLineSymbolV2(object):
+    @staticmethod
+    def createSimple(props):
+        return QgsLineSymbolV2()
+
+    def clone(self):
+        return QgsLineSymbolV2()
+
+    def width(self):
+        return 0.0
+
+    def startRender(self, renderContext):
+        pass
+
+    def stopRender(self, renderContext):
+        pass
+
+    def renderPolyline(self, polyline, *args):
+        Counter.polylines += 1
+        Counter.vertices += polyline.size()
+
+
+class QgsSymbolLayerV2Utils(object):
+    # Elements are made by the document given, as the stubs have no DOM.
+    @staticmethod
+    def saveSymbol(name, symbol, doc, props):
+        element = doc.createElement('symbol')
+        element.setAttribute('name', name)
+        return element
+
+    @staticmethod
+    def loadSymbol(element):
+        return QgsLineSymbolV2()
+
+
+class QgsMessageLog(object):
+    INFO, WARNING, CRITICAL = range(3)
+    # The (message, tag) of every message logged.
+    messages = []
+
+    @staticmethod
+    def logMessage(message, tag='', level=0):
+        QgsMessageLog.messages.append((message, tag))
+
+
+class QgsMapLayerRegistry(QObject):
+    layerWillBeRemoved = pyqtSignal(str)
+    _instance = None
+
+    def __init__(self):
+        self._layers = {}
+
+    @classmethod
+    def instance(cls):
+        if cls._instance is None:
+            cls._instance = QgsMapLayerRegistry()
+        return cls._instance
+
+    def mapLayers(self):
+        return dict(self._layers)
+
+    def mapLayer(self, layerId):
+        return self._layers.get(layerId)
+
+    def addMapLayer(self, layer):
+        self._layers[layer.id()] = layer
+        return layer
+
+    def removeMapLayer(self, layerId):
+        if layerId in self._layers:
+            self.layerWillBeRemoved.emit(layerId)
+            del self._layers[layerId]
+
+
+class QgsPluginLayer(QObject):
+    def __init__(self, layerType, name):
+        self._id = '{0}{1}'.format(layerType, id(self))
+        self._crs = QgsCoordinateReferenceSystem()
+        self._extent = QgsRectangle()
+
+    def id(self):
+        return self._id
+
+    def setValid(self, valid):
+        pass
+
+    def crs(self):
+        return self._crs
+
+    def setCrs(self, crs):
+        self._crs = crs
+
+    def extent(self):
+        return self._extent
+
+    def setExtent(self, extent):
+        self._extent = extent
+
+    def setCacheImage(self, image):
+        pass
+
+
+class _Anything(object):
+    '''Stands in for the classes only the user interface uses.'''
+    def __init__(self, *args, **kwargs):
+        pass
+
+
+def _module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    sys.modules[name] = module
+    return module
+
+
+def install():
+    '''
+    Installs the stubs as the PyQt4 and qgis modules, unless the real ones
+    can be imported. Returns whether they were installed.
+    '''
+    try:
+        import PyQt4.QtCore
+        import qgis.core
+        return False
+    except ImportError:
+        pass
+
+    qtcore = _module('PyQt4.QtCore', SIGNAL=SIGNAL, pyqtSignal=pyqtSignal, QObject=QObject,
+                     QVariant=QVariant, QSettings=QSettings, QThread=QThread, QRunnable=QRunnable,
+                     QThreadPool=QThreadPool, QPointF=QPointF)
+    qtgui = _module('PyQt4.QtGui', QPolygonF=QPolygonF, QImage=QImage, QPainter=QPainter,
+                    QDialog=QDialog, QDoubleValidator=_Anything)
+    qtxml = _module('PyQt4.QtXml', QDomDocument=QDomDocument)
+    _module('PyQt4', QtCore=qtcore, QtGui=qtgui, QtXml=qtxml)
+
+    core = _module('qgis.core', QGis=QGis, QgsPoint=QgsPoint, QgsRectangle=QgsRectangle,
+                   QgsCsException=QgsCsException,
+                   QgsCoordinateReferenceSystem=QgsCoordinateReferenceSystem,
+                   QgsCoordinateTransform=QgsCoordinateTransform, QgsProject=QgsProject,
+                   QgsMapToPixel=QgsMapToPixel, QgsRenderContext=QgsRenderContext,
+                   QgsField=QgsField, QgsGeometry=QgsGeometry, QgsFeature=QgsFeature,
+                   QgsLabel=QgsLabel, QgsLabelAttributes=QgsLabelAttributes, QgsLineSymbolV2=QgsLineSymbolV2,
+                   QgsSymbolLayerV2Utils=QgsSymbolLayerV2Utils,
+                   QgsMessageLog=QgsMessageLog, QgsMapLayerRegistry=QgsMapLayerRegistry,
+                   QgsPluginLayer=QgsPluginLayer)
+    gui = _module('qgis.gui', QgsMapTool=_Anything)
+    _module('qgis', core=core, gui=gui)
+
+    return True
@@ -0,0 +1,433 @@
+"""
+/***************************************************************************
+ test_gridpluginlayer - Tests of the grid layer, run against the stubs.
+                                 A QGIS plugin
+ Overlays a user-definable grid on the map.
+                             -------------------
+        begin                : 2026-10-18
+        copyright            : (C) 2026 by agent
+        email                : agent@local
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Run from the plugin directory:
+
+    python -m unittest test_gridpluginlayer
+"""
+
+import unittest
+
+import numpy
+
+import stubqgis
+stubqgis.install()
+
+from qgis import core
+from qgis.core import QGis
+
+from gridgeometry import buildGrid
+from gridpluginlayer import GridPluginLayer, Subgrid, _formatAttribute, _readAttribute
+from gridvectorlayers import GridVectorLayers
+
+
+class RecordingSymbol(core.QgsLineSymbolV2):
+    '''Records the arguments and pixel vertices of every renderPolyline.'''
+
+    def __init__(self):
+        self.calls = []
+
+    def renderPolyline(self, polyline, *args):
+        points = [(polyline.at(i).x(), polyline.at(i).y()) for i in xrange(polyline.size())]
+        self.calls.append((args, points))
+
+
+class RenderPolylineTest(unittest.TestCase):
+    def setUp(self):
+        self.version = QGis.QGIS_VERSION_INT
+
+        self.layer = GridPluginLayer()
+        self.layer.origin = core.QgsPoint(0.0, 0.0)
+        self.layer.numCellsX = 4
+        self.layer.numCellsY = 3
+        self.layer.cellSizeX = 10.0
+        self.layer.cellSizeY = 10.0
+        self.layer.tileCache = None
+        self.layer.generateGrid()
+
+        # 1 pixel per map unit, with the map's top left at (-10, 40).
+        self.context = core.QgsRenderContext(core.QgsRectangle(-10.0, -10.0, 50.0, 40.0), 60, 50)
+
+    def tearDown(self):
+        QGis.QGIS_VERSION_INT = self.version
+
+    def draw(self, version):
+        QGis.QGIS_VERSION_INT = version
+        self.layer.symbol = RecordingSymbol()
+        self.layer.draw(self.context)
+        return self.layer.symbol.calls
+
+    def checkCalls(self, calls, args):
+        # Each line is rendered once, from end to end.
+        self.assertEqual(len(calls), 4 + 5)
+        for callArgs, points in calls:
+            self.assertEqual(callArgs, args)
+
+        self.checkPoints(calls[0][1], [(10.0, 40.0), (50.0, 40.0)])
+        self.checkPoints(calls[4][1], [(10.0, 40.0), (10.0, 10.0)])
+
+    def checkPoints(self, points, expected):
+        self.assertEqual(len(points), len(expected))
+        for (x, y), (expectedX, expectedY) in zip(points, expected):
+            self.assertAlmostEqual(x, expectedX)
+            self.assertAlmostEqual(y, expectedY)
+
+    def testBefore18(self):
+        calls = self.draw(10700)
+        self.checkCalls(calls, (self.context,))
+
+    def test18(self):
+        calls = self.draw(10800)
+        self.checkCalls(calls, (None, self.context))
+
+    def testBranchesDrawTheSame(self):
+        before = [points for args, points in self.draw(10700)]
+        after = [points for args, points in self.draw(10800)]
+        self.assertEqual(before, after)
+
+
+class LevelOfDetailTest(unittest.TestCase):
+    def setUp(self):
+        self.projectSrsid = stubqgis.projectSrsid
+
+        self.layer = GridPluginLayer()
+        self.layer.setCrs(core.QgsCoordinateReferenceSystem(stubqgis.GEOGRAPHIC_SRSID,
+                                                            core.QgsCoordinateReferenceSystem.InternalCrsId))
+        self.layer.origin = core.QgsPoint(-50.0, -50.0)
+        self.layer.numCellsX = self.layer.numCellsY = 2000
+        self.layer.cellSizeX = self.layer.cellSizeY = 0.05
+        self.layer.tileCache = None
+        self.layer.generateGrid()
+
+    def tearDown(self):
+        stubqgis.projectSrsid = self.projectSrsid
+
+    def context(self):
+        xmin, ymin, xmax, ymax = self.layer.projectedExtent()
+        renderContext = core.QgsRenderContext(core.QgsRectangle(xmin, ymin, xmax, ymax), 500, 500)
+        return renderContext, self.layer._layerView(renderContext.extent(), self.layer._transform())
+
+    def draw(self):
+        stubqgis.Counter.reset()
+        self.layer.draw(self.context()[0])
+        return stubqgis.Counter.polylines, stubqgis.Counter.vertices
+
+    def testStraightLinesAreDrawnEndToEnd(self):
+        polylines, vertices = self.draw()
+        self.assertLess(polylines, 2 * 2001)
+        self.assertEqual(vertices, 2 * polylines)
+
+    def testReprojectedLinesAreSampledAtTheDrawnLines(self):
+        stubqgis.projectSrsid = stubqgis.MERCATOR_SRSID
+        polylines, vertices = self.draw()
+        # A point where each drawn line crosses, rather than every one of the
+        # 2001 vertices of each line.
+        rowStride, colStride = self.layer._levelOfDetail(*self.context())
+        self.assertGreater(colStride, 1)
+        self.assertLessEqual(vertices, polylines * (2000 // colStride + 3))
+
+
+class CellAtTest(unittest.TestCase):
+    def setUp(self):
+        self.projectSrsid = stubqgis.projectSrsid
+
+        self.layer = GridPluginLayer()
+        self.layer.setCrs(self.crs(stubqgis.GEOGRAPHIC_SRSID))
+        self.layer.origin = core.QgsPoint(0.0, 0.0)
+        self.layer.numCellsX = 4
+        self.layer.numCellsY = 3
+        self.layer.cellSizeX = 10.0
+        self.layer.cellSizeY = 10.0
+        self.layer.tileCache = None
+        self.layer.generateGrid()
+
+    def tearDown(self):
+        stubqgis.projectSrsid = self.projectSrsid
+
+    def crs(self, srsid):
+        return core.QgsCoordinateReferenceSystem(srsid, core.QgsCoordinateReferenceSystem.InternalCrsId)
+
+    def testCellAt(self):
+        self.assertEqual(self.layer.cellAt(core.QgsPoint(15.0, 25.0)), (1, 2, '1 2'))
+        self.assertEqual(self.layer.cellAt(core.QgsPoint(0.0, 0.0)), (0, 0, '0 0'))
+
+    def testOffTheGrid(self):
+        for x, y in ((-1.0, 5.0), (45.0, 5.0), (5.0, -1.0), (5.0, 30.0)):
+            self.assertIsNone(self.layer.cellAt(core.QgsPoint(x, y)))
+
+    def testOffsets(self):
+        self.layer.gridOffsetX = 2
+        self.layer.gridOffsetY = 1
+        self.layer.generateGrid()
+
+        self.assertEqual(self.layer.cellAt(core.QgsPoint(25.0, 15.0))[:2], (0, 0))
+        self.assertEqual(self.layer.cellAt(core.QgsPoint(55.0, 35.0))[:2], (3, 2))
+        self.assertIsNone(self.layer.cellAt(core.QgsPoint(15.0, 15.0)))
+
+    def testRotation(self):
+        self.layer.baselineAngle = 30.0
+        self.layer.generateGrid()
+        grid = self.layer.grid
+
+        for col, row in ((0, 0), (3, 1), (2, 2)):
+            x, y = grid.cellCentre(col, row)
+            self.assertEqual(self.layer.cellAt(core.QgsPoint(float(x), float(y)))[:2], (col, row))
+
+        # Beyond the last column.
+        x, y = grid.cellCentre(4, 0)
+        self.assertIsNone(self.layer.cellAt(core.QgsPoint(float(x), float(y))))
+
+    def testCellsAt(self):
+        cols, rows, inside = self.layer.cellsAt(numpy.array([5.0, 35.0, -5.0]), numpy.array([5.0, 25.0, 5.0]))
+        self.assertEqual(list(inside), [True, True, False])
+        self.assertEqual(list(cols[inside]), [0, 3])
+        self.assertEqual(list(rows[inside]), [0, 2])
+
+    def testProjectCrs(self):
+        stubqgis.projectSrsid = stubqgis.MERCATOR_SRSID
+        point = self.layer._transform().transform(core.QgsPoint(15.0, 25.0))
+        self.assertEqual(self.layer.cellAt(point, True), (1, 2, '1 2'))
+
+    def testUntransformablePoint(self):
+        # Latitudes beyond the poles have no Mercator coordinates.
+        self.layer.setCrs(self.crs(stubqgis.MERCATOR_SRSID))
+        self.assertRaises(core.QgsCsException, self.layer.cellAt, core.QgsPoint(0.0, 95.0), True)
+
+
+class PlaceLabelsTest(unittest.TestCase):
+    def setUp(self):
+        self.layer = GridPluginLayer()
+        self.layer.origin = core.QgsPoint(0.0, 0.0)
+        self.layer.numCellsX = 4
+        self.layer.numCellsY = 3
+        self.layer.cellSizeX = 10.0
+        self.layer.cellSizeY = 10.0
+        self.layer.draw_labels = True
+        self.layer.label_type = 0
+        self.layer.tileCache = None
+        self.layer.generateGrid()
+
+        self.rendered = []
+        self.layer.label.renderLabel = lambda renderContext, feat, selected: self.rendered.append(feat)
+
+    def draw(self, extent, width, height):
+        del self.rendered[:]
+        self.layer.drawLabels(core.QgsRenderContext(extent, width, height))
+        return [(unicode(feat.attributeMap()[3].toString()), unicode(feat.attributeMap()[0].toString()))
+                for feat in self.rendered]
+
+    def testCornerLabelsAreBothPlaced(self):
+        # The horizontal and vertical labels at the first vertex share their
+        # anchor, but are aligned away from each other.
+        labels = self.draw(core.QgsRectangle(-10.0, -10.0, 50.0, 40.0), 600, 500)
+        self.assertIn(('top', '0'), labels)
+        self.assertIn(('right', '0'), labels)
+
+    def testLabelsAreThinnedToTheTextHeight(self):
+        self.layer.numCellsX = self.layer.numCellsY = 1000
+        self.layer.cellSizeX = self.layer.cellSizeY = 0.1
+        self.layer.minLineSpacing = 0.0
+        self.layer.label_type = 2
+        self.layer.generateGrid()
+        self.layer.setStatisticsEnabled(True)
+
+        self.draw(core.QgsRectangle(-10.0, -10.0, 110.0, 110.0), 1000, 1000)
+        considered = (self.layer.statistics.counts['labels culled'] +
+                      self.layer.statistics.counts['labels rendered'])
+        # At most one label per text height square of the screen.
+        textHeight = self.layer._labelTextHeight(core.QgsRenderContext(core.QgsRectangle(), 1000, 1000))
+        self.assertLessEqual(considered, (1000.0 / textHeight + 1) ** 2)
+
+
+class LogStatisticsTest(unittest.TestCase):
+    def testReportIsLogged(self):
+        layer = GridPluginLayer()
+        layer.tileCache = None
+        layer.generateGrid()
+        layer.setStatisticsEnabled(True, log=True)
+
+        del core.QgsMessageLog.messages[:]
+        layer.draw(core.QgsRenderContext(core.QgsRectangle(-10.0, -10.0, 50.0, 40.0), 60, 50))
+
+        self.assertEqual(len(core.QgsMessageLog.messages), 1)
+        message, tag = core.QgsMessageLog.messages[0]
+        self.assertEqual(tag, 'Grid overlay')
+        self.assertIn('draw', message)
+
+
+class LineFeaturesTest(unittest.TestCase):
+    def testLinesAreEndToEnd(self):
+        grid = buildGrid(core.QgsPoint(0.0, 0.0), 10.0, 10.0, 0.0, 0, 0, 4, 3)
+        features = list(GridVectorLayers._lineFeatures(grid))
+
+        self.assertEqual(len(features), 4 + 5)
+        for feat in features:
+            self.assertEqual(len(feat.geometry.polyline), 2)
+
+        start, end = features[0].geometry.polyline
+        self.assertEqual((start.x(), start.y()), (0.0, 0.0))
+        self.assertAlmostEqual(end.x(), 40.0)
+        self.assertAlmostEqual(end.y(), 0.0)
+
+    def testLargeGridsAreThinned(self):
+        grid = buildGrid(core.QgsPoint(0.0, 0.0), 1.0, 1.0, 0.0, 0, 0, 150000, 100000)
+        count = sum(1 for feat in GridVectorLayers._lineFeatures(grid))
+
+        self.assertLessEqual(count, GridVectorLayers.MAX_FEATURES)
+        self.assertGreater(count, GridVectorLayers.MAX_FEATURES // 2)
+
+
+class SubgridTest(unittest.TestCase):
+    def setUp(self):
+        self.layer = GridPluginLayer()
+        self.layer.origin = core.QgsPoint(0.0, 0.0)
+        self.layer.numCellsX = self.layer.numCellsY = 4
+        self.layer.cellSizeX = self.layer.cellSizeY = 10.0
+        self.layer.tileCache = None
+        self.layer.generateGrid()
+        self.layer.setSubgrids([Subgrid(5, 5), Subgrid(2, 2, draw_labels=True)])
+
+    def testLinesPerLevel(self):
+        symbols = [RecordingSymbol() for level in xrange(3)]
+        self.layer.symbol = symbols[0]
+        for subgrid, symbol in zip(self.layer.subgrids, symbols[1:]):
+            subgrid.symbol = symbol
+
+        # 10 pixels per map unit, so the finest cells are 10 pixels apart.
+        self.layer.draw(core.QgsRenderContext(core.QgsRectangle(-5.0, -5.0, 45.0, 45.0), 500, 500))
+
+        # 5 + 5 lines, then 21 + 21 and 41 + 41 less those of the level above.
+        self.assertEqual([len(symbol.calls) for symbol in symbols], [10, 32, 40])
+
+    def testXmlRoundTrip(self):
+        node = FakeElement('maplayer')
+        self.layer.writeXml(node, FakeDocument())
+
+        subgridElements = [child for child in node.children if child.tag == 'subgrid']
+        self.assertEqual(len(subgridElements), 2)
+        self.assertEqual(subgridElements[0].firstChildElement('symbol').attribute('name'), 'subgrid_lines')
+
+        layer = GridPluginLayer()
+        layer.readXml(node)
+
+        self.assertEqual([(subgrid.divisionsX, subgrid.divisionsY, subgrid.minSpacing, subgrid.draw_labels)
+                          for subgrid in layer.subgrids],
+                         [(5, 5, 8.0, False), (2, 2, 8.0, True)])
+        self.assertEqual(layer.numCellsX, 4)
+
+
+class FakeDocument(object):
+    def createElement(self, tag):
+        return FakeElement(tag)
+
+
+class FakeElement(object):
+    '''The parts of QDomElement that readXml and writeXml use; stubqgis has no DOM.'''
+
+    def __init__(self, tag='', attributes=None, children=(), null=False):
+        self.tag = tag
+        self.attributes = dict(attributes or {})
+        self.children = []
+        self.parent = None
+        self.null = null
+
+        for child in children:
+            self.appendChild(child)
+
+    def isNull(self):
+        return self.null
+
+    def toElement(self):
+        return self
+
+    def hasAttribute(self, name):
+        return name in self.attributes
+
+    def attribute(self, name, default=''):
+        return self.attributes.get(name, default)
+
+    def setAttribute(self, name, value):
+        self.attributes[name] = value
+
+    def appendChild(self, child):
+        child.parent = self
+        self.children.append(child)
+
+    def firstChildElement(self, tag):
+        for child in self.children:
+            if child.tag == tag:
+                return child
+
+        return FakeElement(null=True)
+
+    def nextSiblingElement(self, tag):
+        siblings = self.parent.children
+        for sibling in siblings[siblings.index(self) + 1:]:
+            if sibling.tag == tag:
+                return sibling
+
+        return FakeElement(null=True)
+
+
+class XmlTest(unittest.TestCase):
+    def testBooleans(self):
+        element = FakeElement(attributes={'a': 'False', 'b': 'True', 'c': '0', 'd': '1', 'e': 'maybe'})
+
+        self.assertIs(_readAttribute(element, 'a', bool, True), False)
+        self.assertIs(_readAttribute(element, 'b', bool, False), True)
+        self.assertIs(_readAttribute(element, 'c', bool, True), False)
+        self.assertIs(_readAttribute(element, 'd', bool, False), True)
+        self.assertIs(_readAttribute(element, 'e', bool, True), True)
+        self.assertIs(_readAttribute(element, 'missing', bool, False), False)
+
+    def testFloatsRoundTrip(self):
+        element = FakeElement()
+
+        for value in (0.1, 1.0 / 3.0, 2.0 ** 0.5, 123456789.12345679, -1e-300, 0.0):
+            element.setAttribute('value', _formatAttribute(value, float))
+            self.assertEqual(_readAttribute(element, 'value', float, None), value)
+
+    def testReadXml(self):
+        layer = GridPluginLayer()
+        label = FakeElement('label', {'draw_labels': 'False'})
+        layer.readXml(FakeElement('maplayer', {'grid_version': '1', 'cell_size_x': repr(0.1 + 0.2),
+                                               'num_cells_x': '7'}, [label]))
+
+        self.assertIs(layer.draw_labels, False)
+        self.assertEqual(layer.cellSizeX, 0.1 + 0.2)
+        self.assertEqual(layer.numCellsX, 7)
+        self.assertEqual(layer.grid.numCellsX, 7)
+
+    def testNewerVersionIsReadWithAWarning(self):
+        layer = GridPluginLayer()
+
+        del core.QgsMessageLog.messages[:]
+        layer.readXml(FakeElement('maplayer', {'grid_version': '1'}))
+        self.assertEqual(core.QgsMessageLog.messages, [])
+
+        layer.readXml(FakeElement('maplayer', {'grid_version': str(GridPluginLayer.XML_VERSION + 1),
+                                               'num_cells_x': '7'}))
+        self.assertEqual(len(core.QgsMessageLog.messages), 1)
+        self.assertIn('grid_version 2', core.QgsMessageLog.messages[0][0])
+        self.assertEqual(layer.numCellsX, 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
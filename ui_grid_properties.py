@@ -149,6 +149,24 @@ class Ui_GridProperties(object):
         spacerItem5 = QtGui.QSpacerItem(40, 20, QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Minimum)
         self.horizontalLayout_6.addItem(spacerItem5)
         self.formLayout.setLayout(5, QtGui.QFormLayout.FieldRole, self.horizontalLayout_6)
+        self.label_20 = QtGui.QLabel(self.tabGrid)
+        self.label_20.setObjectName(_fromUtf8("label_20"))
+        self.formLayout.setWidget(6, QtGui.QFormLayout.LabelRole, self.label_20)
+        self.horizontalLayout_12 = QtGui.QHBoxLayout()
+        self.horizontalLayout_12.setObjectName(_fromUtf8("horizontalLayout_12"))
+        self.spinMinSpacing = QtGui.QDoubleSpinBox(self.tabGrid)
+        sizePolicy = QtGui.QSizePolicy(QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Fixed)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.spinMinSpacing.sizePolicy().hasHeightForWidth())
+        self.spinMinSpacing.setSizePolicy(sizePolicy)
+        self.spinMinSpacing.setDecimals(1)
+        self.spinMinSpacing.setMaximum(100.0)
+        self.spinMinSpacing.setObjectName(_fromUtf8("spinMinSpacing"))
+        self.horizontalLayout_12.addWidget(self.spinMinSpacing)
+        spacerItem6 = QtGui.QSpacerItem(40, 20, QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Minimum)
+        self.horizontalLayout_12.addItem(spacerItem6)
+        self.formLayout.setLayout(6, QtGui.QFormLayout.FieldRole, self.horizontalLayout_12)
         self.verticalLayout_2.addLayout(self.formLayout)
         self.horizontalLayout_7 = QtGui.QHBoxLayout()
         self.horizontalLayout_7.setObjectName(_fromUtf8("horizontalLayout_7"))
@@ -160,11 +178,11 @@ class Ui_GridProperties(object):
         self.btnStyle.setSizePolicy(sizePolicy)
         self.btnStyle.setObjectName(_fromUtf8("btnStyle"))
         self.horizontalLayout_7.addWidget(self.btnStyle)
-        spacerItem6 = QtGui.QSpacerItem(40, 20, QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Minimum)
-        self.horizontalLayout_7.addItem(spacerItem6)
+        spacerItem7 = QtGui.QSpacerItem(40, 20, QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Minimum)
+        self.horizontalLayout_7.addItem(spacerItem7)
         self.verticalLayout_2.addLayout(self.horizontalLayout_7)
-        spacerItem7 = QtGui.QSpacerItem(20, 40, QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Expanding)
-        self.verticalLayout_2.addItem(spacerItem7)
+        spacerItem8 = QtGui.QSpacerItem(20, 40, QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Expanding)
+        self.verticalLayout_2.addItem(spacerItem8)
         self.tabWidget.addTab(self.tabGrid, _fromUtf8(""))
         self.tabLabel = QtGui.QWidget()
         self.tabLabel.setObjectName(_fromUtf8("tabLabel"))
@@ -275,13 +293,48 @@ class Ui_GridProperties(object):
         self.btnColour = QtGui.QPushButton(self.boxLabels)
         self.btnColour.setObjectName(_fromUtf8("btnColour"))
         self.verticalLayout_3.addWidget(self.btnColour)
-        spacerItem8 = QtGui.QSpacerItem(20, 40, QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Expanding)
-        self.verticalLayout_3.addItem(spacerItem8)
+        spacerItem9 = QtGui.QSpacerItem(20, 40, QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Expanding)
+        self.verticalLayout_3.addItem(spacerItem9)
         self.horizontalLayout_8.addLayout(self.verticalLayout_3)
-        spacerItem9 = QtGui.QSpacerItem(40, 20, QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Minimum)
-        self.horizontalLayout_8.addItem(spacerItem9)
+        spacerItem10 = QtGui.QSpacerItem(40, 20, QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Minimum)
+        self.horizontalLayout_8.addItem(spacerItem10)
         self.verticalLayout_4.addWidget(self.boxLabels)
         self.tabWidget.addTab(self.tabLabel, _fromUtf8(""))
+        self.tabSubgrids = QtGui.QWidget()
+        self.tabSubgrids.setObjectName(_fromUtf8("tabSubgrids"))
+        self.verticalLayout_5 = QtGui.QVBoxLayout(self.tabSubgrids)
+        self.verticalLayout_5.setObjectName(_fromUtf8("verticalLayout_5"))
+        self.tableSubgrids = QtGui.QTableWidget(self.tabSubgrids)
+        self.tableSubgrids.setSelectionMode(QtGui.QAbstractItemView.SingleSelection)
+        self.tableSubgrids.setSelectionBehavior(QtGui.QAbstractItemView.SelectRows)
+        self.tableSubgrids.setObjectName(_fromUtf8("tableSubgrids"))
+        self.tableSubgrids.setColumnCount(4)
+        self.tableSubgrids.setRowCount(0)
+        item = QtGui.QTableWidgetItem()
+        self.tableSubgrids.setHorizontalHeaderItem(0, item)
+        item = QtGui.QTableWidgetItem()
+        self.tableSubgrids.setHorizontalHeaderItem(1, item)
+        item = QtGui.QTableWidgetItem()
+        self.tableSubgrids.setHorizontalHeaderItem(2, item)
+        item = QtGui.QTableWidgetItem()
+        self.tableSubgrids.setHorizontalHeaderItem(3, item)
+        self.tableSubgrids.horizontalHeader().setStretchLastSection(True)
+        self.verticalLayout_5.addWidget(self.tableSubgrids)
+        self.horizontalLayout_13 = QtGui.QHBoxLayout()
+        self.horizontalLayout_13.setObjectName(_fromUtf8("horizontalLayout_13"))
+        self.btnAddSubgrid = QtGui.QPushButton(self.tabSubgrids)
+        self.btnAddSubgrid.setObjectName(_fromUtf8("btnAddSubgrid"))
+        self.horizontalLayout_13.addWidget(self.btnAddSubgrid)
+        self.btnRemoveSubgrid = QtGui.QPushButton(self.tabSubgrids)
+        self.btnRemoveSubgrid.setObjectName(_fromUtf8("btnRemoveSubgrid"))
+        self.horizontalLayout_13.addWidget(self.btnRemoveSubgrid)
+        self.btnSubgridStyle = QtGui.QPushButton(self.tabSubgrids)
+        self.btnSubgridStyle.setObjectName(_fromUtf8("btnSubgridStyle"))
+        self.horizontalLayout_13.addWidget(self.btnSubgridStyle)
+        spacerItem11 = QtGui.QSpacerItem(40, 20, QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Minimum)
+        self.horizontalLayout_13.addItem(spacerItem11)
+        self.verticalLayout_5.addLayout(self.horizontalLayout_13)
+        self.tabWidget.addTab(self.tabSubgrids, _fromUtf8(""))
         self.verticalLayout.addWidget(self.tabWidget)
         self.buttonBox = QtGui.QDialogButtonBox(GridProperties)
         self.buttonBox.setOrientation(QtCore.Qt.Horizontal)
@@ -302,7 +355,8 @@ class Ui_GridProperties(object):
         GridProperties.setTabOrder(self.spinOffsetY, self.spinCellSizeX)
         GridProperties.setTabOrder(self.spinCellSizeX, self.spinCellSizeY)
         GridProperties.setTabOrder(self.spinCellSizeY, self.spinAngle)
-        GridProperties.setTabOrder(self.spinAngle, self.btnStyle)
+        GridProperties.setTabOrder(self.spinAngle, self.spinMinSpacing)
+        GridProperties.setTabOrder(self.spinMinSpacing, self.btnStyle)
         GridProperties.setTabOrder(self.btnStyle, self.buttonBox)
         GridProperties.setTabOrder(self.buttonBox, self.tabWidget)
         GridProperties.setTabOrder(self.tabWidget, self.boxLabels)
@@ -319,6 +373,10 @@ class Ui_GridProperties(object):
         GridProperties.setTabOrder(self.spinXOffsetHorizontal, self.spinXOffsetVertical)
         GridProperties.setTabOrder(self.spinXOffsetVertical, self.spinYOffsetHorizontal)
         GridProperties.setTabOrder(self.spinYOffsetHorizontal, self.spinYOffsetVertical)
+        GridProperties.setTabOrder(self.spinYOffsetVertical, self.tableSubgrids)
+        GridProperties.setTabOrder(self.tableSubgrids, self.btnAddSubgrid)
+        GridProperties.setTabOrder(self.btnAddSubgrid, self.btnRemoveSubgrid)
+        GridProperties.setTabOrder(self.btnRemoveSubgrid, self.btnSubgridStyle)
 
     def retranslateUi(self, GridProperties):
         GridProperties.setWindowTitle(QtGui.QApplication.translate("GridProperties", "Grid Overlay Properties", None, QtGui.QApplication.UnicodeUTF8))
@@ -331,6 +389,9 @@ class Ui_GridProperties(object):
         self.label_3.setText(QtGui.QApplication.translate("GridProperties", "Grid offset", None, QtGui.QApplication.UnicodeUTF8))
         self.label_4.setText(QtGui.QApplication.translate("GridProperties", "Cell size", None, QtGui.QApplication.UnicodeUTF8))
         self.label_5.setText(QtGui.QApplication.translate("GridProperties", "Baseline angle", None, QtGui.QApplication.UnicodeUTF8))
+        self.label_20.setText(QtGui.QApplication.translate("GridProperties", "Minimum line spacing", None, QtGui.QApplication.UnicodeUTF8))
+        self.spinMinSpacing.setToolTip(QtGui.QApplication.translate("GridProperties", "When zoomed out, only every 2nd, 5th, 10th... line is drawn, keeping the lines at least this far apart. 0 draws every line.", None, QtGui.QApplication.UnicodeUTF8))
+        self.spinMinSpacing.setSuffix(QtGui.QApplication.translate("GridProperties", " px", None, QtGui.QApplication.UnicodeUTF8))
         self.btnStyle.setText(QtGui.QApplication.translate("GridProperties", "Set Grid Style...", None, QtGui.QApplication.UnicodeUTF8))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.tabGrid), QtGui.QApplication.translate("GridProperties", "Grid", None, QtGui.QApplication.UnicodeUTF8))
         self.boxLabels.setTitle(QtGui.QApplication.translate("GridProperties", "Display labels", None, QtGui.QApplication.UnicodeUTF8))
@@ -358,4 +419,17 @@ class Ui_GridProperties(object):
         self.btnFont.setText(QtGui.QApplication.translate("GridProperties", "Font", None, QtGui.QApplication.UnicodeUTF8))
         self.btnColour.setText(QtGui.QApplication.translate("GridProperties", "Colour", None, QtGui.QApplication.UnicodeUTF8))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.tabLabel), QtGui.QApplication.translate("GridProperties", "Labels", None, QtGui.QApplication.UnicodeUTF8))
+        self.tableSubgrids.setToolTip(QtGui.QApplication.translate("GridProperties", "Each subgrid divides the cells of the one above it, and is only drawn once its cells are at least its minimum spacing apart.", None, QtGui.QApplication.UnicodeUTF8))
+        item = self.tableSubgrids.horizontalHeaderItem(0)
+        item.setText(QtGui.QApplication.translate("GridProperties", "Divisions x", None, QtGui.QApplication.UnicodeUTF8))
+        item = self.tableSubgrids.horizontalHeaderItem(1)
+        item.setText(QtGui.QApplication.translate("GridProperties", "Divisions y", None, QtGui.QApplication.UnicodeUTF8))
+        item = self.tableSubgrids.horizontalHeaderItem(2)
+        item.setText(QtGui.QApplication.translate("GridProperties", "Min spacing", None, QtGui.QApplication.UnicodeUTF8))
+        item = self.tableSubgrids.horizontalHeaderItem(3)
+        item.setText(QtGui.QApplication.translate("GridProperties", "Labels", None, QtGui.QApplication.UnicodeUTF8))
+        self.btnAddSubgrid.setText(QtGui.QApplication.translate("GridProperties", "Add", None, QtGui.QApplication.UnicodeUTF8))
+        self.btnRemoveSubgrid.setText(QtGui.QApplication.translate("GridProperties", "Remove", None, QtGui.QApplication.UnicodeUTF8))
+        self.btnSubgridStyle.setText(QtGui.QApplication.translate("GridProperties", "Set Subgrid Style...", None, QtGui.QApplication.UnicodeUTF8))
+        self.tabWidget.setTabText(self.tabWidget.indexOf(self.tabSubgrids), QtGui.QApplication.translate("GridProperties", "Subgrids", None, QtGui.QApplication.UnicodeUTF8))
 
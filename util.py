@@ -19,10 +19,16 @@
  ***************************************************************************/
 """
 
+import collections
 import math
+import time
+
+import numpy
 
 class QgsVector(object):
   """2D vector class with (almost) the same signature as the QGIS one."""
+  __slots__ = ('x', 'y')
+
   def __init__(self, x=0.0, y=0.0):
     self.x = x
     self.y = y
@@ -36,6 +42,8 @@ class QgsVector(object):
   def __div__(self, scalar):
     return QgsVector(self.x, self.y) * (1.0 / scalar)
 
+  __truediv__ = __div__
+
   def __add__(self, v):
     return QgsVector(self.x + v.x, self.y + v.y)
 
@@ -57,15 +65,164 @@ class QgsVector(object):
       return v.angle() - self.angle()
 
   def rotateBy(self, rot):
-    ang = math.atan2(self.y, self.x) + rot
-    length = self.length()
-    return QgsVector(length * math.cos(ang), length * math.sin(ang))
+    cos, sin = math.cos(rot), math.sin(rot)
+    return QgsVector(self.x * cos - self.y * sin, self.x * sin + self.y * cos)
 
   def normal(self):
-    if self.length() == 0.0:
-      raise
+    length = self.length()
+    if length == 0.0:
+      raise ZeroDivisionError('Cannot normalise a zero length vector')
+
+    return QgsVector(self.x / length, self.y / length)
+
+class Basis(object):
+    """
+    The affine map origin + col * baseVec + row * perpVec, applied to whole
+    arrays of (col, row) positions at once.
+    """
+    __slots__ = ('originX', 'originY', 'baseVec', 'perpVec', 'det')
+
+    def __init__(self, originX, originY, baseVec, perpVec):
+        self.originX = originX
+        self.originY = originY
+        self.baseVec = baseVec
+        self.perpVec = perpVec
+        self.det = baseVec.x * perpVec.y - perpVec.x * baseVec.y
+
+    def apply(self, cols, rows):
+        """Returns the (xs, ys) of col and row arrays, broadcast together."""
+        cols = numpy.asarray(cols, dtype=numpy.float64)
+        rows = numpy.asarray(rows, dtype=numpy.float64)
+        shape = numpy.broadcast(cols, rows).shape
+        xs = numpy.empty(shape)
+        ys = numpy.empty(shape)
+        scratch = numpy.empty(shape)
+
+        # origin + (row * perp + col * base), the order of the vector
+        # arithmetic that the grid was first built with.
+        for out, origin, perp, base in ((xs, self.originX, self.perpVec.x, self.baseVec.x),
+                                         (ys, self.originY, self.perpVec.y, self.baseVec.y)):
+            numpy.multiply(rows, perp, out=out)
+            numpy.multiply(cols, base, out=scratch)
+            out += scratch
+            out += origin
+
+        return xs, ys
+
+    def solve(self, xs, ys):
+        """Returns the fractional (cols, rows) that apply maps to xs and ys."""
+        bx, by = self.baseVec.x, self.baseVec.y
+        px, py = self.perpVec.x, self.perpVec.y
+        dx = numpy.asarray(xs, dtype=numpy.float64) - self.originX
+        dy = numpy.asarray(ys, dtype=numpy.float64) - self.originY
+
+        return (dx * py - dy * px) / self.det, (bx * dy - by * dx) / self.det
+
+class LRUCache(object):
+    """
+    A dictionary that discards its least recently used items beyond maxSize,
+    passing each to onDiscard(key, value) if given.
+    """
+    def __init__(self, maxSize, onDiscard=None):
+        self.maxSize = maxSize
+        self.onDiscard = onDiscard
+        self._items = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        try:
+            value = self._items.pop(key)
+        except KeyError:
+            return default
+
+        self._items[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self._items.pop(key, None)
+
+        while len(self._items) >= self.maxSize:
+            oldKey, oldValue = self._items.popitem(last=False)
+            if self.onDiscard is not None:
+                self.onDiscard(oldKey, oldValue)
+
+        self._items[key] = value
+
+    def resize(self, maxSize):
+        self.maxSize = maxSize
+
+        while len(self._items) > maxSize:
+            oldKey, oldValue = self._items.popitem(last=False)
+            if self.onDiscard is not None:
+                self.onDiscard(oldKey, oldValue)
+
+    def items(self):
+        return list(self._items.items())
+
+    def clear(self):
+        self._items.clear()
+
+class Statistics(object):
+    """
+    Timers and counters by stage. While disabled they record nothing and
+    cost next to nothing, so they can stay in hot paths.
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.times = collections.defaultdict(float)
+        self.calls = collections.defaultdict(int)
+        self.counts = collections.defaultdict(int)
+
+    def timer(self, name):
+        """Returns a context manager that adds its duration to name."""
+        return _Timer(self, name) if self.enabled else _NULL_TIMER
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counts[name] += n
+
+    def reset(self):
+        self.times.clear()
+        self.calls.clear()
+        self.counts.clear()
+
+    def snapshot(self):
+        return {'times': dict(self.times), 'calls': dict(self.calls), 'counts': dict(self.counts)}
+
+    def report(self):
+        lines = ['{0}: {1:.2f} ms in {2} calls'.format(name, self.times[name] * 1000.0, self.calls[name])
+                 for name in sorted(self.times)]
+        lines.extend('{0}: {1}'.format(name, self.counts[name]) for name in sorted(self.counts))
+        return '\n'.join(lines)
+
+class _Timer(object):
+    __slots__ = ('statistics', 'name', 'start')
 
-    return QgsVector(self.x, self.y) / self.length()
+    def __init__(self, statistics, name):
+        self.statistics = statistics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+
+    def __exit__(self, *exc):
+        self.statistics.times[self.name] += time.time() - self.start
+        self.statistics.calls[self.name] += 1
+        return False
+
+class _NullTimer(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _NullTimer()
 
 class Angle():
     cardinals = ('N', 'E', 'S', 'W')
@@ -80,65 +237,96 @@ class Angle():
         self.seconds, self.fracSeconds = divmod(self.fracMinutes * 60.0, 1.0)
         
     def __format__(self, format_spec):
-        s = ''
+        return AngleFormat.compile(format_spec).format(self)
+
+def _whole(value, pad, width):
+    if pad:
+        return str(int(value)).zfill(width)
+    else:
+        return str(int(value))
+
+def _fraction(value, precision):
+    return '{0:f}'.format(value).ljust(2 + precision, '0')[2:2 + precision]
+
+_fields = {
+    'g': lambda angle, pad, precision: angle.sign,
+    'D': lambda angle, pad, precision: _whole(angle.degrees, pad, 3),
+    'd': lambda angle, pad, precision: _fraction(angle.fracDegrees, precision),
+    'M': lambda angle, pad, precision: _whole(angle.minutes, pad, 2),
+    'm': lambda angle, pad, precision: _fraction(angle.fracMinutes, precision),
+    'S': lambda angle, pad, precision: _whole(angle.seconds, pad, 2),
+    's': lambda angle, pad, precision: _fraction(angle.fracSeconds, precision),
+    'n': lambda angle, pad, precision: Angle.cardinals[0] if angle.sign == '' else Angle.cardinals[2],
+    'e': lambda angle, pad, precision: Angle.cardinals[1] if angle.sign == '' else Angle.cardinals[3]
+   }
+
+class AngleFormat(object):
+    """
+    An Angle format spec, parsed once into a list of fields.
+
+    The spec is literal text mixed with %[0][precision]<field>, where field is
+    one of g (sign), D/d (degrees, decimal degrees), M/m (minutes, decimal
+    minutes), S/s (seconds, decimal seconds), n (N/S) or e (E/W).
+    """
+    _compiled = {}
+
+    def __init__(self, format_spec, cacheSize=1024):
+        self.tokens = []
+        self._labels = LRUCache(cacheSize)
         b, m, e = format_spec.partition('%')
 
         while e != '':
             pad = False
             precision = 0
-            s += b
-            
+
             precPos = 0
             while e[precPos].isdigit():
                 precPos += 1
-                
+
             precString = e[:precPos]
-        
+
             if precString != '':
                 if precString[0] == '0':
                     pad = True
-            
+
                 precision = int(precString)
 
             spec = e[precPos]
-            
-            if spec == 'g':
-                s += self.sign
-            elif spec == 'D':
-                if pad:
-                    s += str(int(self.degrees)).zfill(3)
-                else:
-                    s += str(int(self.degrees))
-            elif spec == 'd':
-                s += '{0:f}'.format(self.fracDegrees).ljust(2 + precision, '0')[2:2 + precision]
-            elif spec == 'M':
-                if pad:
-                    s += str(int(self.minutes)).zfill(2)
-                else:
-                    s += str(int(self.minutes))
-            elif spec == 'm':
-                s += '{0:f}'.format(self.fracMinutes).ljust(2 + precision, '0')[2:2 + precision]
-            elif spec == 'S':
-                if pad:
-                    s += str(int(self.seconds)).zfill(2)
-                else:
-                    s += str(int(self.seconds))
-            elif spec == 's':
-                s += '{0:f}'.format(self.fracSeconds).ljust(2 + precision, '0')[2:2 + precision]
-            elif spec == 'n':
-                if self.sign == '':
-                    s += Angle.cardinals[0]
-                else:
-                    s += Angle.cardinals[2]
-            elif spec == 'e':
-                if self.sign == '':
-                    s += Angle.cardinals[1]
-                else:
-                    s += Angle.cardinals[3]
-            else:
+
+            if spec not in _fields:
                 raise ValueError("Invalid format specifier '%c'" % spec)
-                
+
+            self.tokens.append((b, _fields[spec], pad, precision))
             b, m, e = e[precPos + 1:].partition('%')
-            
-        s += b
-        return s
+
+        self.tail = b
+
+    @classmethod
+    def compile(cls, format_spec):
+        """Returns the shared AngleFormat for a spec, parsing it on first use."""
+        formatter = cls._compiled.get(format_spec)
+
+        if formatter is None:
+            formatter = cls._compiled[format_spec] = cls(format_spec)
+
+        return formatter
+
+    def format(self, angle):
+        s = ''
+
+        for literal, field, pad, precision in self.tokens:
+            s += literal
+            s += field(angle, pad, precision)
+
+        return s + self.tail
+
+    def formatValue(self, degrees):
+        """Formats a value in degrees, reusing earlier results for the same value."""
+        # Keyed on the exact value, since values that round the same can
+        # still format differently.
+        labeltext = self._labels.get(degrees)
+
+        if labeltext is None:
+            labeltext = self._labels[degrees] = self.format(Angle(degrees))
+
+        return labeltext